@@ -0,0 +1,77 @@
+"""Compare the backends of the blend and pixelate filters.
+
+Every filter renderer of `Manip` is run on a fixed avatar with each of
+the filter backends, in the current process, without Discord.
+
+Usage:
+    python -m benchmarks.filters [--size 512] [--runs 50]
+"""
+import argparse
+import inspect
+import statistics
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from boribay.core.utils import filters
+from boribay.core.utils.layouts import layouts
+from boribay.core.utils.manipulation import Manip
+
+from .fixtures import make_avatar
+
+RENDERERS = ("pixelate", "jail", "rainbow", "communist")
+
+
+def measure(func, runs: int) -> dict:
+    timings = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "mean_ms": round(statistics.mean(timings) * 1000, 2),
+        "min_ms": round(min(timings) * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=512, help="The avatar size.")
+    parser.add_argument("--runs", type=int, default=50, help="Runs per case.")
+    args = parser.parse_args()
+
+    avatar = make_avatar(args.size)
+    frame = Image.open(BytesIO(avatar))
+    frame.load()
+
+    for backend in filters.BACKENDS:
+        filters.use_backend(backend)
+
+        try:
+            layouts.warm_up(
+                wand=("jailbars.png", "rainbow.png", "communist-flag.jpg")
+                if backend == "wand"
+                else ()
+            )
+        except Exception as e:
+            print(f"{backend:>7}: skipped, {e}")
+            continue
+
+        for name in RENDERERS:
+            # The undecorated renderer, decoding and encoding included.
+            renderer = inspect.unwrap(getattr(Manip, name))
+            total = measure(lambda: renderer(BytesIO(avatar), fmt="png"), args.runs)
+            line = f"{backend:>7} {name:>10}: {total['mean_ms']:>8} ms render"
+
+            if backend != "wand":
+                alone = measure(lambda: filters.FILTERS[name](frame), args.runs)
+                line += f", {alone['mean_ms']:>8} ms filter"
+
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Fixed inputs of the benchmarks, generated so no network is needed."""
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+
+def make_avatar(size: int = 512) -> bytes:
+    """Draw a photo-like avatar of the given size, as PNG."""
+    image = Image.radial_gradient("L").resize((size, size)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((size // 4, size // 4, size * 3 // 4, size * 3 // 4), "orange")
+    image = Image.blend(image, Image.effect_noise((size, size), 40).convert("RGB"), 0.3)
+
+    buffer = BytesIO()
+    image.save(buffer, "png")
+    return buffer.getvalue()
+
+
+def make_animation(size: int = 128, frames: int = 24) -> bytes:
+    """Draw an animated GIF avatar with a moving circle."""
+    images = []
+
+    for i in range(frames):
+        image = Image.new("RGB", (size, size), (40, 60 + i * 4, 120))
+        offset = i * (size // 2) // frames
+        ImageDraw.Draw(image).ellipse(
+            (offset, offset, offset + size // 2, offset + size // 2), "orange"
+        )
+        images.append(image)
+
+    buffer = BytesIO()
+    images[0].save(
+        buffer, "gif", save_all=True, append_images=images[1:], duration=60, loop=0
+    )
+    return buffer.getvalue()
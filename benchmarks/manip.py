@@ -0,0 +1,260 @@
+"""Benchmark every `Manip` renderer on every render engine backend.
+
+Each renderer gets fixed avatar and text inputs and is called by rounds
+of N concurrent calls. Latency percentiles, throughput and output size
+are printed and written as JSON, so that the results of two commits can
+be compared with --compare.
+
+The peak resident memory is a high-water mark of the processes, so it is
+reported once per backend run rather than per case: it covers every case
+of the run, and the bot process part everything run before it as well.
+
+The Python allocations of a single call are traced with tracemalloc as
+well, i.e the buffers copied between the download, the renderer and the
+upload. With the process backend only the bot process side is traced.
+
+Usage:
+    python -m benchmarks.manip [--backends inline,thread,process]
+        [--concurrency 8] [--rounds 5] [--only wanted,jail]
+        [--output results.json] [--compare previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import PIL
+
+from boribay.core.utils.manipulation import Manip
+from boribay.core.utils.rendering import render_cache, render_engine
+
+from .fixtures import make_animation, make_avatar
+
+AVATAR = make_avatar(512)
+SMALL_AVATAR = make_avatar(128)
+TINY_AVATAR = make_avatar(64)
+ANIMATION = make_animation()
+TEXT = "The quick brown fox jumps over the lazy dog"
+
+# The renderer calls by case names, the inputs are shared bytes.
+CASES: Dict[str, Callable] = {
+    "typeracer": lambda: Manip.typeracer(TEXT),
+    "welcome": lambda: Manip.welcome("Member #42", TEXT, AVATAR),
+    # A full grid, as a join burst gets it, see `boribay.core.welcomes`.
+    "welcome_grid": lambda: Manip.welcome_grid(
+        "Members #1-#25 just spawned in the server.",
+        [f"Member #{i}" for i in range(1, 26)],
+        [AVATAR] * 25,
+    ),
+    "pixelate": lambda: Manip.pixelate(AVATAR),
+    "pixelate[gif]": lambda: Manip.pixelate(ANIMATION),
+    "whyareyougae": lambda: Manip.whyareyougae(SMALL_AVATAR, AVATAR),
+    "fiveguysonegirl": lambda: Manip.fiveguysonegirl(SMALL_AVATAR, AVATAR),
+    "wanted": lambda: Manip.wanted(AVATAR),
+    "fight": lambda: Manip.fight(TINY_AVATAR, AVATAR),
+    "clyde": lambda: Manip.clyde(TEXT),
+    "drake": lambda: Manip.drake(TEXT, TEXT[::-1]),
+    "jail": lambda: Manip.jail(AVATAR),
+    "press_f": lambda: Manip.press_f(AVATAR),
+    "rainbow": lambda: Manip.rainbow(AVATAR),
+    "communist": lambda: Manip.communist(AVATAR),
+    "swirl": lambda: Manip.swirl(120, AVATAR),
+    "achievement": lambda: Manip.achievement("Achievement get!", TEXT),
+    "pipeline": lambda: Manip.pipeline("pixelate | wanted | jail", AVATAR),
+}
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+def peak_rss() -> int:
+    """The process peak, i.e of this process and the render workers, in KB."""
+    pids = [os.getpid()]
+
+    if render_engine._processes is not None:
+        pids += list(render_engine._processes._processes or ())
+
+    total = 0
+
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                total += next(
+                    int(line.split()[1]) for line in f if line.startswith("VmHWM:")
+                )
+        except (OSError, StopIteration):
+            if pid == os.getpid():
+                total += resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return total
+
+
+async def run_case(call: Callable, concurrency: int, rounds: int) -> dict:
+    latencies = []
+    sizes = []
+
+    async def timed():
+        start = time.perf_counter()
+        output = await call()
+        latencies.append(time.perf_counter() - start)
+        sizes.append(len(output))
+
+    # One warm-up round, so pools and lazy layouts are not measured.
+    await asyncio.gather(*(timed() for _ in range(concurrency)))
+    latencies.clear()
+    sizes.clear()
+
+    start = time.perf_counter()
+
+    for _ in range(rounds):
+        await asyncio.gather(*(timed() for _ in range(concurrency)))
+
+    elapsed = time.perf_counter() - start
+    return {
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "throughput": round(len(latencies) / elapsed, 2),
+        "output_kb": round(statistics.mean(sizes) / 1024, 1),
+        **await trace_allocations(call),
+    }
+
+
+async def trace_allocations(call: Callable) -> dict:
+    """The peak of the Python allocations during a single call.
+
+    Image buffers alive at the same time add up in the peak, so every
+    extra copy of the input or of the output shows up there.
+    """
+    tracemalloc.start()
+
+    try:
+        await call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"alloc_peak_kb": round(peak / 1024, 1)}
+
+
+async def run_backend(
+    backend: str, cases: Iterable[str], concurrency: int, rounds: int
+) -> Tuple[dict, float]:
+    render_engine.shutdown()
+    render_engine.backend = backend
+    render_engine.start()
+    results = {}
+
+    try:
+        for name in cases:
+            try:
+                results[name] = await run_case(CASES[name], concurrency, rounds)
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+
+            print(format_result(backend, name, results[name]), flush=True)
+
+        # Read before the shutdown, while the workers are still there.
+        peak = round(peak_rss() / 1024, 1)
+        print(f"{backend:>8} {'process peak':>16}: {peak} MB RSS", flush=True)
+    finally:
+        render_engine.shutdown()
+
+    return results, peak
+
+
+def format_result(backend: str, name: str, result: dict, previous: dict = None) -> str:
+    if "error" in result:
+        return f"{backend:>8} {name:>16}: {result['error']}"
+
+    line = (
+        f"{backend:>8} {name:>16}: p50 {result['p50_ms']:>8} ms, "
+        f"p95 {result['p95_ms']:>8} ms, {result['throughput']:>7}/s, "
+        f"{result['output_kb']:>7} KB, alloc {result['alloc_peak_kb']:>8} KB"
+    )
+
+    if previous and "p50_ms" in previous:
+        change = (result["p50_ms"] / previous["p50_ms"] - 1) * 100
+        line += f" ({change:+.1f}% p50)"
+
+    return line
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ("git", "rev-parse", "--short", "HEAD"),
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="inline,thread,process")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--only", help="Comma-separated case names.")
+    parser.add_argument("--cache", action="store_true", help="Keep the render cache.")
+    parser.add_argument("--output", help="Where to write the JSON results.")
+    parser.add_argument("--compare", help="Previous JSON results to compare with.")
+    args = parser.parse_args()
+
+    cases = args.only.split(",") if args.only else list(CASES)
+
+    if unknown := set(cases) - set(CASES):
+        sys.exit(f"Unknown cases: {', '.join(unknown)}")
+
+    if not args.cache:
+        # Nothing fits into the cache, every call renders.
+        render_cache.max_bytes = 0
+
+    previous = {}
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "cpus": os.cpu_count(),
+        "workers": render_engine.workers,
+        "concurrency": args.concurrency,
+        "rounds": args.rounds,
+        "process_peak_rss_mb": {},
+        "results": {},
+    }
+
+    for backend in args.backends.split(","):
+        results, peak = asyncio.run(
+            run_backend(backend, cases, args.concurrency, args.rounds)
+        )
+        report["process_peak_rss_mb"][backend] = peak
+        report["results"][backend] = results
+
+        if backend in previous:
+            print(f"\nCompared with {args.compare}:")
+            for name, result in results.items():
+                old = previous[backend].get(name)
+                print(format_result(backend, name, result, old))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,10 +12,19 @@ import asyncpg
 import discord
 from discord.ext import commands
 
-from boribay.settings import DEVELOPMENT
-from .database import Cache, DatabaseManager
+from boribay.settings import (
+    DEVELOPMENT,
+    LEDGER_FLUSH_MS,
+    USER_CACHE_MAX_SIZE,
+    USER_CACHE_TTL,
+    WELCOME_BURST_THRESHOLD,
+    WELCOME_BURST_WINDOW,
+    WELCOME_QUEUE_SIZE,
+)
+from .database import Cache, ChangeFeed, DatabaseManager
 from .events import set_events
-from .utils import Context, is_blacklisted
+from .utils import Context, is_blacklisted, render_engine, render_scheduler
+from .welcomes import AutoroleWorker, Greeter
 
 __all__ = ("Boribay",)
 
@@ -143,16 +152,59 @@ class Boribay(commands.Bot):
 
     async def close(self) -> None:
         await super().close()
+        await self.greeter.close()
+        await self.autoroles.close()
+        await self.db.close()
+        await self.change_feed.close()
         await self.session.close()
+        render_engine.shutdown()
 
     async def setup(self):
         # Data-related.
-        self.pool = await asyncpg.create_pool("postgresql://postgres:@localhost:6543/postgres")
-        self.db = DatabaseManager(self)
+        dsn = "postgresql://postgres:@localhost:6543/postgres"
+        self.pool = await asyncpg.create_pool(dsn)
+        self.db = DatabaseManager(self, flush_interval=LEDGER_FLUSH_MS / 1000)
+        self.db.start()
         self.guild_cache = await Cache(
             "SELECT * FROM guild_config", "guild_id", self.pool
         )
-        self.user_cache = await Cache("SELECT * FROM users", "user_id", self.pool)
+        self.user_cache = await Cache(
+            "SELECT * FROM users",
+            "user_id",
+            self.pool,
+            lazy=True,
+            max_size=USER_CACHE_MAX_SIZE,
+            ttl=USER_CACHE_TTL,
+            pending=self.db.pending,
+        )
+
+        # Keeping caches of several bot processes in sync.
+        self.change_feed = ChangeFeed(
+            dsn, {"guild_config": self.guild_cache, "users": self.user_cache}
+        )
+        self.change_feed.hooks["users"].append(self.db.on_user_change)
+        self.change_feed.reloads.append(self.db.leaderboard.load)
+
+        # Render queue weights of the guilds, followed through the change feed.
+        for guild_id, config in self.guild_cache.items():
+            render_scheduler.set_weight(guild_id, config.get("render_weight"))
+
+        self.change_feed.hooks["guild_config"].append(render_scheduler.on_guild_change)
+        await self.change_feed.start()
+
+        # Pre-forking the image render workers.
+        render_engine.start()
+
+        # Welcoming the joined members without flooding the API on raids.
+        self.greeter = Greeter(
+            self,
+            threshold=WELCOME_BURST_THRESHOLD,
+            window=WELCOME_BURST_WINDOW,
+            max_queue=WELCOME_QUEUE_SIZE,
+        )
+        self.greeter.start()
+        self.autoroles = AutoroleWorker(self)
+        self.autoroles.start()
 
         # Checks to limit certain things.
         self.add_check(is_blacklisted)
@@ -1,53 +1,553 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+from bisect import bisect_left, insort
 from collections import defaultdict
-from typing import Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
+import asyncpg
 import discord
 from asyncpg.pool import Pool
 
+from .exceptions import NotEnough
+
+logger = logging.getLogger("bot.database")
+
 
 class Cache(defaultdict):
     """Cache loader for Boribay created in order to use less DB calls.
 
     Any kind of caching stuff is done by this class.
 
+    By default the whole table gets loaded at once. In the lazy mode
+    rows are read through on the first `fetch` of their key instead,
+    the cache size is capped with LRU eviction and rows expire after `ttl`.
+
+    `pending` may return the not yet written column deltas of a key,
+    those get applied on top of every row coming from the database.
+
     This class inherits from `collections.defaultdict`.
     """
 
-    def __init__(self, query: str, key: str, db: Pool):
+    def __init__(
+        self,
+        query: str,
+        key: str,
+        db: Pool,
+        *,
+        lazy: bool = False,
+        max_size: Optional[int] = None,
+        ttl: Optional[float] = None,
+        pending: Optional[Callable[..., Dict[str, int]]] = None,
+    ):
         super().__init__(dict)
         self.query = query
         self.key = key
         self.db = db
+        self.lazy = lazy
+        self.max_size = max_size
+        self.ttl = ttl
+        self.pending = pending
+        self.hits = 0
+        self.misses = 0
+        self._stored_at = {}
 
     def __await__(self):  # await Cache(...
         return self.cache_db().__await__()
 
+    @property
+    def stats(self) -> dict:
+        """Hit/miss counters of the lazy mode."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
     async def cache_db(self):
-        """Cache database method."""
+        """Cache database method.
+
+        Does nothing in the lazy mode since rows are loaded on demand.
+        """
+        if self.lazy:
+            return self
+
         records = await self.db.fetch(self.query)
 
         for record in records:
-            d = dict(record)
-            self[d.pop(self.key)] = d
+            self.patch(record)
 
         return self
 
     async def refresh(self):
-        """Refresh cache method."""
+        """Refresh cache method.
+
+        This reloads the whole table, so it should be kept for explicit
+        admin operations only, use `patch` for the regular writes instead.
+        """
         self.clear()
+        self._stored_at.clear()
         await self.cache_db()
         return self
 
+    async def fetch(self, key) -> dict:
+        """Get a cached row, loading it from the database in the lazy mode.
+
+        Args:
+            key: The key column value of the row.
+
+        Returns:
+            dict: The cached row, empty if there is no such row in the table.
+        """
+        if not self.lazy:
+            return self[key]
+
+        if key in self and not self._expired(key):
+            self.hits += 1
+            self[key] = self.pop(key)  # Moving the row to the LRU end.
+            return self[key]
+
+        self.misses += 1
+        record = await self.db.fetchrow(
+            f'{self.query} WHERE "{self.key}" = $1', key
+        )
+        if record is None:  # Remembering missing rows to not query them again.
+            self._store(key, {})
+            return self[key]
+
+        return self.patch(record)
+
+    def patch(self, record) -> dict:
+        """Patch a single row of the cache with a fresh database record.
+
+        Args:
+            record (asyncpg.Record): The changed row, e.g from `RETURNING *`.
+
+        Returns:
+            dict: The cached row without its key column.
+        """
+        d = dict(record)
+        key = d.pop(self.key)
+
+        if self.pending is not None:
+            for column, delta in self.pending(key).items():
+                d[column] += delta
+
+        self._store(key, d)
+        return d
+
+    def drop(self, key) -> None:
+        """Drop a single row from the cache, if it is cached at all.
+
+        Args:
+            key: The key column value of the row to drop.
+        """
+        self.pop(key, None)
+        self._stored_at.pop(key, None)
+
+    def _store(self, key, row: dict) -> None:
+        if not self.lazy:
+            self[key] = row
+            return
+
+        self.pop(key, None)  # Moving the row to the LRU end.
+        self[key] = row
+        self._stored_at[key] = time.monotonic()
+
+        while self.max_size is not None and len(self) > self.max_size:
+            self.drop(next(iter(self)))
+
+    def _expired(self, key) -> bool:
+        # Rows that were not stored by this class (i.e defaultdict ones)
+        # have no timestamp and are considered expired as well.
+        if (stored_at := self._stored_at.get(key)) is None:
+            return True
+
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+
+class Leaderboard:
+    """In-memory ranking of users by their net worth (wallet + bank).
+
+    The ranking is a list of `(-worth, user_id)` kept sorted with `bisect`,
+    so both the top-N and the rank of a user are answered without a query.
+    Until the initial load is done the expression index on the net worth
+    is used instead.
+    """
+
+    def __init__(self, pool: Pool, *, pending: Optional[Callable] = None):
+        self.pool = pool
+        self.pending = pending
+        self.ready = False
+        self._worth = {}
+        self._ranking = []
+        # The rows changed during a load by user ID, None for the removed ones.
+        self._changes: Optional[Dict[int, Optional[dict]]] = None
+
+    async def load(self) -> None:
+        """Build the ranking from the users table, from scratch if loaded.
+
+        The ranking in use is only replaced once the new one is complete,
+        with the rows that changed while the table was being read.
+        """
+        self._changes = {}
+
+        try:
+            records = await self.pool.fetch("SELECT user_id, wallet, bank FROM users;")
+        finally:
+            changes, self._changes = self._changes, None
+
+        worth = {record["user_id"]: self._worth_of(record) for record in records}
+
+        # Queued deltas need no replay, `_worth_of` counts the pending ones.
+        for user_id, row in changes.items():
+            if row is None:
+                worth.pop(user_id, None)
+            else:
+                worth[user_id] = self._worth_of(row)
+
+        self._worth = worth
+        self._ranking = sorted((-w, user_id) for user_id, w in worth.items())
+        self.ready = True
+        logger.info(f"Leaderboard has been loaded with {len(records)} users.")
+
+    def track(self, row) -> None:
+        """Update the ranking with a fresh `users` row.
+
+        Args:
+            row: The changed row, either a record or a dict.
+        """
+        self._set(row["user_id"], self._worth_of(row))
+
+        if self._changes is not None:
+            self._changes[row["user_id"]] = row
+
+    def shift(self, user_id: int, delta: int) -> None:
+        """Move a known user in the ranking by a net worth delta.
+
+        Args:
+            user_id (int): The ID of the user.
+            delta (int): The net worth change.
+        """
+        if (worth := self._worth.get(user_id)) is not None:
+            self._set(user_id, worth + delta)
+
+    def remove(self, user_id: int) -> None:
+        """Remove a user from the ranking.
+
+        Args:
+            user_id (int): The ID of the user.
+        """
+        self._discard(user_id)
+
+        if self._changes is not None:
+            self._changes[user_id] = None
+
+    async def top(self, limit: int) -> List[Tuple[int, int]]:
+        """Get the richest users.
+
+        Args:
+            limit (int): Amount of users to get.
+
+        Returns:
+            List[Tuple[int, int]]: User ID and net worth pairs.
+        """
+        if self.ready:
+            return [(user_id, -worth) for worth, user_id in self._ranking[:limit]]
+
+        query = """
+        SELECT user_id, wallet + bank AS worth FROM users
+        ORDER BY wallet + bank DESC LIMIT $1;
+        """
+        return [tuple(row) for row in await self.pool.fetch(query, limit)]
+
+    async def rank(self, user_id: int) -> Optional[int]:
+        """Get the place of a user in the ranking.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            Optional[int]: The place, starting from 1. None if not registered.
+        """
+        if not self.ready:
+            query = """
+            SELECT count(*) + 1 FROM users
+            WHERE wallet + bank > (SELECT wallet + bank FROM users WHERE user_id = $1)
+            HAVING EXISTS (SELECT 1 FROM users WHERE user_id = $1);
+            """
+            return await self.pool.fetchval(query, user_id)
+
+        if (worth := self._worth.get(user_id)) is None:
+            return None
+
+        # Users sharing the same net worth share the same place.
+        return bisect_left(self._ranking, (-worth,)) + 1
+
+    def _worth_of(self, row) -> int:
+        worth = row["wallet"] + row["bank"]
+
+        if self.pending is not None:
+            worth += sum(self.pending(row["user_id"]).values())
+
+        return worth
+
+    def _discard(self, user_id: int) -> None:
+        if (worth := self._worth.pop(user_id, None)) is not None:
+            del self._ranking[bisect_left(self._ranking, (-worth, user_id))]
+
+    def _set(self, user_id: int, worth: int) -> None:
+        self._discard(user_id)
+        self._worth[user_id] = worth
+        insort(self._ranking, (-worth, user_id))
+
+
+class ChangeFeed:
+    """Cross-process cache invalidation for Boribay.
+
+    Triggers from `data/schema.sql` send a NOTIFY payload for every changed
+    row of the cached tables, this class listens to them on a dedicated
+    connection and patches the local caches row by row, so several bot
+    processes can share the same state without polling.
+
+    Callables in `hooks` get every `(op, row, flush)` change of their
+    table, `flush` being the tag of the ledger flush that made it, if any.
+    Coroutine functions in `reloads` get awaited along with the cache
+    reloads after a reconnect, for the state derived from the tables.
+    """
+
+    channel = "cache_changes"
+
+    def __init__(self, dsn: str, caches: Dict[str, Cache]):
+        self.dsn = dsn
+        self.caches = caches
+        self.hooks = defaultdict(list)
+        self.reloads = []
+        self.connection = None
+        self._closed = False
+
+    async def start(self) -> None:
+        """Open the dedicated connection and start listening."""
+        self.connection = await asyncpg.connect(self.dsn)
+        self.connection.add_termination_listener(self._on_termination)
+        await self.connection.add_listener(self.channel, self._on_notify)
+
+    async def close(self) -> None:
+        """Stop listening and close the dedicated connection."""
+        self._closed = True
+
+        if self.connection is not None and not self.connection.is_closed():
+            await self.connection.close()
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        data = json.loads(payload)
+        row = data["row"]
+
+        # Hooks run first, they may settle the deltas `Cache.patch` adds.
+        for hook in self.hooks[data["table"]]:
+            hook(data["op"], row, data.get("flush"))
+
+        if (cache := self.caches.get(data["table"])) is None:
+            return
+
+        # Lazy caches only keep the rows someone asked for recently.
+        if cache.lazy and row[cache.key] not in cache:
+            return
+
+        if data["op"] == "DELETE":
+            cache.drop(row[cache.key])
+        else:
+            cache.patch(row)
+
+    def _on_termination(self, connection) -> None:
+        if not self._closed:
+            asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        """Reconnect after losing the connection.
+
+        Notifications sent in the meantime are lost, so the caches
+        and the `reloads` get fully reloaded once the feed is back.
+        """
+        delay = 1
+
+        while not self._closed:
+            try:
+                await self.start()
+            except (OSError, asyncpg.PostgresError):
+                logger.warning(f"Change feed is down, reconnecting in {delay}s.")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+
+            for cache in self.caches.values():
+                await cache.refresh()
+
+            for reload in self.reloads:
+                await reload()
+
+            logger.info("Change feed has been reconnected.")
+            return
+
 
 class DatabaseManager(Pool):
     """Database manager for Boribay created in order to ease up manipulation.
 
+    Balance deltas passed to `queue` are merged in memory per user and
+    written by a single batched query every `flush_interval` seconds.
+    Every flush is tagged, so the change feed can tell which deltas a
+    notified row already includes, even before the flush returns.
+
+    Every balance write is also reflected in the `leaderboard`.
+
     This class inherits from `asyncpg.pool.Pool`.
     """
 
-    def __init__(self, bot):
+    flush_query = """
+    UPDATE users
+    SET wallet = users.wallet + d.wallet, bank = users.bank + d.bank
+    FROM unnest($1::BIGINT[], $2::BIGINT[], $3::BIGINT[]) AS d(user_id, wallet, bank)
+    WHERE users.user_id = d.user_id;
+    """
+
+    def __init__(self, bot, *, flush_interval: float = 0.5):
         self.bot = bot
         self.pool = bot.pool
+        self.flush_interval = flush_interval
+        self.ledger = defaultdict(lambda: {"wallet": 0, "bank": 0})
+        self._flushing = {}
+        self._flush_tag = None
+        self._flushes = 0
+        # Telling the flushes of this process from the ones of the others.
+        self._token = secrets.token_hex(4)
+        self._flusher = None
+        self._lock = asyncio.Lock()
+        self.leaderboard = Leaderboard(self.pool, pending=self.pending)
+
+    def start(self) -> None:
+        """Start flushing the ledger and load the leaderboard in the background."""
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._flusher.add_done_callback(self._on_flusher_exit)
+        asyncio.create_task(self.leaderboard.load())
+
+    def on_user_change(self, op: str, row: dict, flush: Optional[str] = None) -> None:
+        """The change feed hook to keep the leaderboard of this process in sync.
+
+        A row written by the running flush of this process already includes
+        its deltas, so they must not be counted as pending anymore.
+        """
+        if flush is not None and flush == self._flush_tag:
+            self._flushing.pop(row["user_id"], None)
+
+        if op == "DELETE":
+            self.leaderboard.remove(row["user_id"])
+        else:
+            self.leaderboard.track(row)
+
+    async def close(self) -> None:
+        """Stop the background flushing and write the remaining deltas."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+
+        # Waits for the flush that may be running at the moment.
+        await self.flush()
+
+    def pending(self, user_id: int) -> Dict[str, int]:
+        """Get the balance deltas of a user that are not written yet.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            Dict[str, int]: Column name to delta mapping.
+        """
+        result = defaultdict(int)
+
+        for ledger in (self._flushing, self.ledger):
+            for column, delta in ledger.get(user_id, {}).items():
+                result[column] += delta
+
+        return result
+
+    def queue(self, column: str, user: discord.Member, amount: int) -> None:
+        """Queue a balance change to be written by the next flush.
+
+        The user cache gets updated right away.
+
+        Args:
+            column (str): Either "wallet" or "bank".
+            user (discord.Member): The user whose balance changes.
+            amount (int): Amount of currency to add, negative to take.
+        """
+        if column not in ("wallet", "bank"):
+            raise ValueError(f"Cannot queue changes of the {column} column.")
+
+        self.ledger[user.id][column] += amount
+        self.leaderboard.shift(user.id, amount)
+
+        if column in (row := self.bot.user_cache.get(user.id, {})):
+            row[column] += amount
+
+    async def flush(self) -> None:
+        """Write all queued balance deltas with a single query."""
+        async with self._lock:
+            if not self.ledger:
+                return
+
+            flushing = self._flushing = self.ledger
+            self.ledger = defaultdict(flushing.default_factory)
+            users = list(flushing)
+            self._flushes += 1
+            self._flush_tag = f"{self._token}:{self._flushes}"
+
+            try:
+                async with self.pool.acquire() as connection:
+                    async with connection.transaction():
+                        # Put into the NOTIFY payloads by `notify_cache_change`.
+                        await connection.execute(
+                            "SELECT set_config('boribay.flush', $1, true);",
+                            self._flush_tag,
+                        )
+                        await connection.execute(
+                            self.flush_query,
+                            users,
+                            [flushing[user]["wallet"] for user in users],
+                            [flushing[user]["bank"] for user in users],
+                        )
+            except Exception:
+                # Putting the deltas back so the next flush retries them.
+                for user, deltas in flushing.items():
+                    self.ledger[user]["wallet"] += deltas["wallet"]
+                    self.ledger[user]["bank"] += deltas["bank"]
+                raise
+            finally:
+                self._flushing = {}
+                self._flush_tag = None
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            try:
+                # Shielded, so cancelling the loop never interrupts a write.
+                await asyncio.shield(self.flush())
+            except Exception:
+                # Never letting the loop die, the deltas stay in the ledger.
+                logger.exception("Could not flush the balance ledger.")
+
+    def _on_flusher_exit(self, task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+
+        logger.error(
+            "Balance ledger flusher has stopped, the deltas are only written "
+            "on close from now on.",
+            exc_info=task.exception(),
+        )
 
     async def _operate(
         self, op: str, column: str, user: discord.Member, amount: Union[int, float]
@@ -63,12 +563,23 @@ class DatabaseManager(Pool):
         Returns:
             None: Means that the method returns nothing.
         """
-        await self.pool.execute(
-            f'UPDATE "users" SET "{column}" = "{column}" {op} $1 WHERE "user_id" = $2;',
+        row = await self.pool.fetchrow(
+            f'UPDATE "users" SET "{column}" = "{column}" {op} $1 WHERE "user_id" = $2 '
+            "RETURNING *;",
             amount,
             user.id,
         )
-        await self.bot.user_cache.refresh()
+        self._patch(self.bot.user_cache, row)
+
+    def _patch(self, cache: Cache, row) -> None:
+        """Patch the changed row into the given cache, if there is one."""
+        if row is None:
+            return
+
+        cache.patch(row)
+
+        if cache is self.bot.user_cache:
+            self.leaderboard.track(row)
 
     async def add(self, *args) -> None:
         """Database Manager add method to ease up mostly Economics manipulation.
@@ -99,18 +610,24 @@ class DatabaseManager(Pool):
     async def push(self, query: str, *args, **kwargs):
         """Just a method to save up 1 line in the code.
 
+        The query should end with `RETURNING *` so the changed row
+        gets patched into the user cache instead of reloading it.
+
         Parameters
         ----------
         query : str
             A query to get executed.
         """
-        await self.pool.execute(query, *args, **kwargs)
-        await self.bot.user_cache.refresh()
+        row = await self.pool.fetchrow(query, *args, **kwargs)
+        self._patch(self.bot.user_cache, row)
 
     async def double(
         self, choice: str, amount: int, reducer: discord.Member, adder: discord.Member
-    ) -> None:
-        """The "double" method to ease up database manipulation.
+    ) -> Tuple[int, int]:
+        """The "double" method to transfer currency between two users.
+
+        Both the debit and the credit are done by one atomic statement,
+        which also makes sure the reducer does not go into debt.
 
         Args:
             choice (str): The column value.
@@ -118,15 +635,46 @@ class DatabaseManager(Pool):
             reducer (discord.Member): The user the money will be taken from.
             adder (discord.Member): The user the money will be added to.
 
+        Raises:
+            NotEnough: If the reducer has not enough currency to transfer.
+
         Returns:
-            None: Means that the method returns nothing.
+            Tuple[int, int]: New balances of the reducer and the adder.
         """
-        reducer_query = f"UPDATE users SET {choice} = {choice} - $1 WHERE user_id = $2"
-        adder_query = f"UPDATE users SET {choice} = {choice} + $1 WHERE user_id = $2"
+        if choice not in ("wallet", "bank"):
+            raise ValueError(f"Cannot transfer the {choice} column.")
+
+        if reducer.id == adder.id:
+            raise ValueError("Cannot transfer currency to the same user.")
+
+        # $4 makes the overdraft guard count the not yet flushed deltas.
+        query = f"""
+        WITH debit AS (
+            UPDATE users SET {choice} = {choice} - $1
+            WHERE user_id = $2 AND {choice} + $4 >= $1
+            AND EXISTS (SELECT 1 FROM users WHERE user_id = $3)
+            RETURNING *
+        ), credit AS (
+            UPDATE users SET {choice} = {choice} + $1
+            WHERE user_id = $3 AND EXISTS (SELECT 1 FROM debit)
+            RETURNING *
+        )
+        SELECT * FROM debit UNION ALL SELECT * FROM credit;
+        """
+        rows = await self.pool.fetch(
+            query, amount, reducer.id, adder.id, self.pending(reducer.id)[choice]
+        )
 
-        await self.pool.execute(reducer_query, amount, reducer.id)
-        await self.pool.execute(adder_query, amount, adder.id)
-        await self.bot.user_cache.refresh()
+        if len(rows) != 2:
+            raise NotEnough(amount)
+
+        balances = {}
+
+        for row in rows:
+            self.leaderboard.track(row)
+            balances[row["user_id"]] = self.bot.user_cache.patch(row)[choice]
+
+        return balances[reducer.id], balances[adder.id]
 
     async def set(
         self, table: str, column: str, user: discord.Member, value: str
@@ -143,6 +691,10 @@ class DatabaseManager(Pool):
             None: Means that the method returns nothing.
         """
         dirs = {"users": "user", "guild_config": "guild"}
-        query = f'UPDATE "{table}" SET "{column}" = $1 WHERE "{dirs[table]}_id" = $2'
-        await self.pool.execute(query, value, user.id)
-        await self.bot.user_cache.refresh()
+        caches = {"users": self.bot.user_cache, "guild_config": self.bot.guild_cache}
+        query = (
+            f'UPDATE "{table}" SET "{column}" = $1 WHERE "{dirs[table]}_id" = $2 '
+            "RETURNING *"
+        )
+        row = await self.pool.fetchrow(query, value, user.id)
+        self._patch(caches[table], row)
@@ -79,15 +79,14 @@ class Developer(utils.Cog):
         Args:
             users (commands.Greedy[discord.Member]): Blacklist several users.
         """
-        query = "UPDATE users SET blacklisted = true WHERE user_id = $1"
+        query = "UPDATE users SET blacklisted = true WHERE user_id = $1 RETURNING *"
 
         for user in users:
-            await ctx.bot.pool.execute(query, user.id)
+            await ctx.db.push(query, user.id)
 
         await ctx.send(
             f'✅ Successfully put **{", ".join(str(x) for x in users)}** into blacklist.'
         )
-        await ctx.user_cache.refresh()
 
     @blacklist.command(name="remove")
     async def _blacklist_remove(
@@ -103,15 +102,169 @@ class Developer(utils.Cog):
         Args:
             users (commands.Greedy[discord.Member]): Unblacklist several users.
         """
-        query = "UPDATE users SET blacklisted = false WHERE user_id = $1"
+        query = "UPDATE users SET blacklisted = false WHERE user_id = $1 RETURNING *"
 
         for user in users:
-            await ctx.bot.pool.execute(query, user.id)
+            await ctx.db.push(query, user.id)
 
         await ctx.send(
             f'✅ Successfully removed **{", ".join(str(x) for x in users)}** from blacklist.'
         )
-        await ctx.user_cache.refresh()
+
+    @utils.group()
+    async def cache(self, ctx: utils.Context) -> None:
+        """Bot caches parent command."""
+        await ctx.send_help("cache")
+
+    def _get_cache(self, ctx: utils.Context, name: str, *, database: bool = True):
+        caches = {"users": ctx.user_cache, "guilds": ctx.guild_cache}
+
+        if not database:
+            caches.update(
+                assets=utils.assets, twemojis=utils.twemojis, renders=utils.render_cache
+            )
+
+        if name not in caches:
+            raise commands.BadArgument(
+                "Invalid cache provided. Available ones are: " + ", ".join(caches)
+            )
+
+        return caches[name]
+
+    @cache.command(name="refresh")
+    async def _cache_refresh(self, ctx: utils.Context, name: str = "users") -> None:
+        """Fully reload one of the bot caches from the database.
+
+        Regular writes patch the cache row by row, so this is only needed
+        when the tables were changed by hand.
+
+        Example:
+            **{p}cache refresh guilds**
+
+        Args:
+            name (str, optional): Either "users" or "guilds". Defaults to "users".
+        """
+        await self._get_cache(ctx, name).refresh()
+        await ctx.message.add_reaction("✅")
+
+    @cache.command(name="stats")
+    async def _cache_stats(self, ctx: utils.Context, name: str = "users") -> None:
+        """See the size and hit/miss counters of one of the bot caches.
+
+        Example:
+            **{p}cache stats renders**
+
+        Args:
+            name (str, optional): One of "users", "guilds", "assets", "twemojis"
+            and "renders". Defaults to "users".
+        """
+        stats = self._get_cache(ctx, name, database=False).stats
+        stats["hit_rate"] = f'{stats["hit_rate"]:.2%}'
+
+        embed = ctx.embed(
+            title=f"Cache stats: {name}",
+            description="\n".join(
+                f'• **{k.replace("_", " ").title()}:** {v}' for k, v in stats.items()
+            ),
+        )
+        await ctx.send(embed=embed)
+
+    @utils.command()
+    async def encodings(self, ctx: utils.Context) -> None:
+        """See the average encoding time and output size of every renderer.
+
+        Example:
+            **{p}encodings**
+        """
+        lines = []
+
+        for name, s in utils.encoder_stats.stats.items():
+            formats = ", ".join(f"{k}: {v}" for k, v in s["formats"].items())
+            lines.append(
+                f'• **{name}:** {s["count"]} renders, {s["avg_ms"]} ms, '
+                f'{s["avg_kb"]} KB ({formats})'
+            )
+
+        embed = ctx.embed(
+            title="Encoder stats",
+            description="\n".join(lines) or "Nothing was rendered yet.",
+        )
+        await ctx.send(embed=embed)
+
+    @utils.command()
+    async def lookups(self, ctx: utils.Context) -> None:
+        """See how long the image arguments of every kind take to resolve.
+
+        Example:
+            **{p}lookups**
+        """
+        lines = []
+
+        for kind, s in utils.image_lookups.stats.items():
+            buckets = ", ".join(f"{k}: {v}" for k, v in s["buckets"].items())
+            lines.append(f'• **{kind}:** {s["count"]} lookups ({buckets})')
+
+        embed = ctx.embed(
+            title="Image lookups",
+            description="\n".join(lines) or "No image was looked up yet.",
+        )
+        await ctx.send(embed=embed)
+
+    @utils.command(name="renderqueue")
+    async def render_queue(self, ctx: utils.Context) -> None:
+        """See the queue depth, wait time and admission counters of the renderer.
+
+        Example:
+            **{p}renderqueue**
+        """
+        stats = utils.render_scheduler.stats
+        embed = ctx.embed(
+            title="Render queue",
+            description="\n".join(
+                f'• **{k.replace("_", " ").title()}:** {v}' for k, v in stats.items()
+            ),
+        )
+        await ctx.send(embed=embed)
+
+    @utils.command(name="renderweight")
+    async def render_weight(
+        self, ctx: utils.Context, guild: discord.Guild, weight: int
+    ) -> None:
+        """Set how many renders a guild gets per turn of the render queue.
+
+        Example:
+            **{p}renderweight 765902232679481394 3**
+
+        Args:
+            guild (discord.Guild): The guild to set the weight of.
+            weight (int): Renders per turn, 1 by default.
+        """
+        if not 1 <= weight <= 10:
+            raise commands.BadArgument("The weight should be between 1 and 10.")
+
+        await ctx.bot.db.set("guild_config", "render_weight", guild, weight)
+        # The change feed does the same, this makes it take effect right away.
+        utils.render_scheduler.set_weight(guild.id, weight)
+        await ctx.send(f"✅ {guild} now gets {weight} renders per turn.")
+
+    @utils.command()
+    async def welcomes(self, ctx: utils.Context) -> None:
+        """See the queues and counters of the welcome cards and autoroles.
+
+        Example:
+            **{p}welcomes**
+        """
+        stats = {
+            **{f"welcome_{k}": v for k, v in ctx.bot.greeter.stats.items()},
+            **{f"autorole_{k}": v for k, v in ctx.bot.autoroles.stats.items()},
+        }
+        embed = ctx.embed(
+            title="Welcomes",
+            description="\n".join(
+                f'• **{k.replace("_", " ").title()}:** {v}' for k, v in stats.items()
+            ),
+        )
+        await ctx.send(embed=embed)
 
     @utils.command()
     async def leave(self, ctx: utils.Context, guild: Optional[discord.Guild]) -> None:
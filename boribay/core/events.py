@@ -1,6 +1,5 @@
 import logging
 from contextlib import suppress
-from io import BytesIO
 
 import discord
 from discord.ext import commands
@@ -9,7 +8,7 @@ from rich.columns import Columns
 from rich.panel import Panel
 from rich.table import Table
 
-from boribay.core import exceptions, utils
+from boribay.core import exceptions
 
 __all__ = ("set_events",)
 
@@ -82,10 +81,10 @@ def set_events(bot):
         guild : discord.Guild
             The new guild.
         """
-        await bot.pool.execute(
-            "INSERT INTO guild_config(guild_id) VALUES($1);", guild.id
+        row = await bot.pool.fetchrow(
+            "INSERT INTO guild_config(guild_id) VALUES($1) RETURNING *;", guild.id
         )
-        await bot.guild_cache.refresh()
+        bot.guild_cache.patch(row)
 
     @bot.event
     async def on_guild_remove(guild: discord.Guild) -> None:
@@ -99,7 +98,7 @@ def set_events(bot):
         await bot.pool.execute(
             "DELETE FROM guild_config WHERE guild_id = $1;", guild.id
         )
-        await bot.guild_cache.refresh()
+        bot.guild_cache.drop(guild.id)
 
     @bot.event
     async def on_command_completion(ctx) -> None:
@@ -116,21 +115,14 @@ def set_events(bot):
     # Member-logging.
     @bot.event
     async def on_member_join(member: discord.Member) -> None:
-        g: discord.Guild = member.guild
-        # Member-logging feature.
-        if wc := bot.guild_cache[g.id].get("welcome_channel", False):
-            image = await utils.Manip.welcome(
-                top_text=f"Member #{g.member_count}",
-                bottom_text=f"{member} just spawned in the server.",
-                member_avatar=BytesIO(await member.avatar.read()),
-            )
-            channel = g.get_channel(wc)
-            file = discord.File(image, f"{member}.png")
-            await channel.send(file=file)
+        config = bot.guild_cache[member.guild.id]
+        # Member-logging feature, bursts of joins get welcomed together.
+        if config.get("welcome_channel", False):
+            bot.greeter.join(member)
 
         # Autorole feature may get triggered according to the guild settings.
-        if role_id := bot.guild_cache[g.id].get("autorole", False):
-            await member.add_roles(g.get_role(role_id), reason="Autorole")
+        if config.get("autorole", False):
+            bot.autoroles.queue(member)
 
     # error handling.
     async def send(ctx, exc: str = None, *args, **kwargs) -> None:
@@ -183,6 +175,7 @@ def set_events(bot):
                 commands.MaxConcurrencyReached,
                 commands.PartialEmojiConversionFailure,
                 exceptions.UserError,
+                exceptions.EconomyError,
             ),
         ):
             embed.description = str(error)
@@ -93,3 +93,11 @@ class EmptyBrackets(CalcError):
 
     def __str__(self):
         return "Given expression has empty brackets."
+
+
+class RendererBusy(UserError):
+    """Raised when the image renderer cannot take any more work right now."""
+
+
+class BadDownload(UserError):
+    """Raised when a given URL does not lead to a usable image."""
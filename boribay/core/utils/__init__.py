@@ -1,6 +1,14 @@
+from .animation import *
 from .checks import *
 from .commands import *
 from .context import *
 from .converters import *
+from .downloads import *
+from .encoding import *
+from .filters import *
+from .layouts import *
 from .manipulation import *
 from .paginators import *
+from .rendering import *
+from .scheduling import *
+from .templates import *
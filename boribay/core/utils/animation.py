@@ -0,0 +1,211 @@
+import asyncio
+import math
+from io import BytesIO
+from time import perf_counter
+from typing import Iterator, List, Tuple
+
+from PIL import Image
+
+from boribay.settings import (
+    RENDER_FRAME_SIZE,
+    RENDER_MAX_DURATION,
+    RENDER_MAX_FRAMES,
+)
+
+from .filters import FILTERS
+from .rendering import render_cache, render_engine
+
+__all__ = ("is_animated", "animate")
+
+# The fewest frames worth a separate worker task.
+MIN_CHUNK = 8
+
+
+def is_animated(data: bytes) -> bool:
+    """Check whether an image has several frames, by its header mostly.
+
+    Args:
+        data (bytes): The image to check.
+
+    Returns:
+        bool: Whether the image is animated.
+    """
+    try:
+        with Image.open(BytesIO(data)) as im:
+            return getattr(im, "is_animated", False)
+    except Image.UnidentifiedImageError:
+        return False
+
+
+def _frames(im: Image.Image, start: int, stop: int) -> Iterator[Image.Image]:
+    """Decode the frames of a range one by one, never holding all of them."""
+    for index in range(start, stop):
+        try:
+            im.seek(index)
+        except EOFError:
+            return
+
+        yield im
+
+
+def _apply(frame: Image.Image, size: Tuple[int, int], name: str, params: dict):
+    frame = frame.convert("RGB")
+    frame.thumbnail(size)
+    return FILTERS[name](frame, **params).convert("RGB")
+
+
+def probe(image: BytesIO, name: str, params: dict, size: Tuple[int, int]) -> dict:
+    """The first stage of an animation: plan the frames and build the palette.
+
+    Frames over `RENDER_MAX_FRAMES` or `RENDER_MAX_DURATION` are dropped.
+    The palette is built once from a few filtered sample frames and then
+    shared by every frame, which saves quantizing each of them from scratch.
+    """
+    durations = []
+    total = 0
+
+    with Image.open(image) as im:
+        loop = im.info.get("loop", 0)
+
+        for frame in _frames(im, 0, RENDER_MAX_FRAMES):
+            duration = frame.info.get("duration") or 100
+
+            if durations and total + duration > RENDER_MAX_DURATION * 1000:
+                break
+
+            durations.append(duration)
+            total += duration
+
+        count = len(durations)
+        samples = []
+
+        for index in sorted({0, count // 3, 2 * count // 3, count - 1}):
+            im.seek(index)
+            samples.append(_apply(im, size, name, params))
+
+    width, height = samples[0].size
+    sheet = Image.new("RGB", (width, height * len(samples)))
+
+    for index, sample in enumerate(samples):
+        sheet.paste(sample, (0, height * index))
+
+    return {
+        "durations": durations,
+        "loop": loop,
+        "size": (width, height),
+        "palette": sheet.quantize(256).getpalette(),
+    }
+
+
+def filter_frames(
+    image: BytesIO,
+    name: str,
+    params: dict,
+    size: Tuple[int, int],
+    palette: List[int],
+    start: int,
+    stop: int,
+) -> bytes:
+    """The second stage: filter a range of frames, run in parallel.
+
+    Returns:
+        bytes: The palette indices of the filtered frames, one after another.
+    """
+    palette_image = Image.new("P", (1, 1))
+    palette_image.putpalette(palette)
+    output = bytearray()
+
+    with Image.open(image) as im:
+        for frame in _frames(im, start, stop):
+            frame = _apply(frame, size, name, params)
+
+            if frame.size != size:
+                frame = frame.resize(size)
+
+            frame = frame.quantize(palette=palette_image, dither=Image.Dither.NONE)
+            output += frame.tobytes()
+
+    return bytes(output)
+
+
+def assemble(
+    chunks: List[bytes],
+    size: Tuple[int, int],
+    palette: List[int],
+    durations: List[int],
+    loop: int,
+) -> BytesIO:
+    """The last stage: encode the filtered frames into a GIF."""
+    start = perf_counter()
+    frame_size = size[0] * size[1]
+    frames = []
+
+    for chunk in chunks:
+        view = memoryview(chunk)
+
+        for offset in range(0, len(view), frame_size):
+            frame = Image.frombytes("P", size, view[offset : offset + frame_size])
+            frame.putpalette(palette)
+            frames.append(frame)
+
+    buffer = BytesIO()
+    frames[0].save(
+        buffer,
+        "gif",
+        save_all=True,
+        append_images=frames[1:],
+        duration=durations,
+        loop=loop,
+    )
+    buffer.encoding = ("gif", perf_counter() - start)
+    buffer.seek(0)
+    return buffer
+
+
+async def animate(name: str, image: bytes, **params) -> bytes:
+    """Apply a frame filter to every frame of an animated image.
+
+    Frames are decoded lazily by the workers, each of them filtering its
+    own range of frames, and the output is encoded once with one palette.
+
+    Args:
+        name (str): The name of the frame filter, see `FILTERS`.
+        image (bytes): The animated image.
+
+    Returns:
+        bytes: The filtered GIF.
+    """
+    key = render_cache.make_key(f"animate.{name}", (image,), params)
+
+    if (output := render_cache.get(key)) is None:
+        size = (RENDER_FRAME_SIZE, RENDER_FRAME_SIZE)
+        plan = await render_engine.run(probe, image, name, params, size)
+        count = len(plan["durations"])
+        step = max(MIN_CHUNK, math.ceil(count / render_engine.workers))
+
+        chunks = await asyncio.gather(
+            *(
+                render_engine.run(
+                    filter_frames,
+                    image,
+                    name,
+                    params,
+                    plan["size"],
+                    plan["palette"],
+                    start,
+                    min(start + step, count),
+                )
+                for start in range(0, count, step)
+            )
+        )
+        output = await render_engine.run(
+            assemble,
+            chunks,
+            plan["size"],
+            plan["palette"],
+            plan["durations"],
+            plan["loop"],
+        )
+        render_cache.put(key, output)
+
+    return output
@@ -97,5 +97,5 @@ async def is_blacklisted(ctx: commands.Context) -> bool:
     bool
         False if the author is blacklisted.
     """
-    user = ctx.user_cache[ctx.author.id]
+    user = await ctx.user_cache.fetch(ctx.author.id)
     return not user.get("blacklisted", False)
@@ -8,6 +8,8 @@ from typing import TYPE_CHECKING, Any
 import discord
 from discord.ext import commands
 
+from .scheduling import render_scheduler
+
 if TYPE_CHECKING:
     from ..bot import Boribay
 
@@ -27,6 +29,7 @@ class Context(commands.Context):
         self.bot: Boribay
         self.timer = Timer(self)
         self.loading = Loading(self)
+        self.rendering = Rendering(self)
 
     @property
     async def db_latency(self) -> float:
@@ -52,6 +55,11 @@ class Context(commands.Context):
     def guild_cache(self):
         return self.bot.guild_cache
 
+    def render_slot(self):
+        """Wait for a render slot without a loading message, see `Rendering`."""
+        guild_id = self.guild.id if self.guild else None
+        return render_scheduler.slot(guild_id, self.author.id)
+
     def embed(self, **kwargs: Any):
         return self.bot.embed(self, **kwargs)
 
@@ -132,3 +140,34 @@ class Loading(ContextDecorator):
 
     async def __aexit__(self, *args):
         await self.ctx.try_delete(self.message)
+
+
+class Rendering(Loading):
+    """Made to wait for a render slot before rendering an image.
+
+    Gets rejected right away if the renderer is too busy, before
+    sending the loading message. The slot is held until the block ends,
+    so it should only wrap the render call, never the downloads.
+
+    This class inherits from `Loading`.
+    """
+
+    def __init__(self, ctx: Context, content: str = "Rendering..."):
+        super().__init__(ctx, content)
+        self.slot = None
+
+    async def __aenter__(self):
+        self.slot = self.ctx.render_slot()
+        await self.slot.__aenter__()
+
+        try:
+            await super().__aenter__()
+        except BaseException as e:
+            await self.slot.__aexit__(type(e), e, e.__traceback__)
+            raise
+
+    async def __aexit__(self, *args):
+        try:
+            await super().__aexit__(*args)
+        finally:
+            await self.slot.__aexit__(*args)
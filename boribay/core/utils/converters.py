@@ -1,25 +1,42 @@
+import functools
 import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
 from contextlib import suppress
 from copy import copy
 from enum import Enum
-from typing import List, Union
+from typing import FrozenSet, List, Optional, Union
 
 import discord
 from discord.ext import commands
 from PIL import ImageColor
 
+from .downloads import assets, twemojis
+
 __all__ = (
     "AuthorCheckConverter",
     "TimeConverter",
     "ImageConverter",
     "ColorConverter",
     "SettingsConverter",
+    "avatar_asset",
+    "classify",
+    "image_lookups",
 )
 
 
-async def is_valid_url(url: str, session):
-    response = await session.head(url)
-    return response.status == 200
+# The codepoints of every twemoji image, one sequence per line.
+TWEMOJI_INDEX = "./data/twemoji.txt"
+# The release the index was taken from, the images never change within it.
+TWEMOJI_URL = "https://cdn.jsdelivr.net/gh/twitter/twemoji@14.0.2/assets/72x72/{}.png"
+
+
+@functools.lru_cache(maxsize=None)
+def twemoji_index() -> FrozenSet[str]:
+    """Load the bundled twemoji index once."""
+    with open(TWEMOJI_INDEX) as f:
+        return frozenset(f.read().split())
 
 
 def codepoint(codes: List[str]):
@@ -28,14 +45,57 @@ def codepoint(codes: List[str]):
     return "-".join(codes)
 
 
-async def emoji_to_url(char, *, session):
+def emoji_to_url(char: str) -> Optional[str]:
+    """Get the twemoji image URL of a unicode emoji.
+
+    This is an in-memory lookup, so plain words cost nothing.
+
+    Args:
+        char (str): The argument that might be an emoji.
+
+    Returns:
+        Optional[str]: The image URL, None if the argument is not an emoji.
+    """
     path = codepoint([f"{ord(c):x}" for c in char])
-    url = f"https://twemoji.maxcdn.com/v/latest/72x72/{path}.png"
 
-    if await is_valid_url(url, session):
-        return url
+    if path in twemoji_index():
+        return TWEMOJI_URL.format(path)
+
+    return None
+
+
+class LatencyHistogram:
+    """Latency histograms of several paths, with fixed buckets in ms."""
+
+    buckets = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
 
-    return char
+    def __init__(self):
+        self._counts = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+
+    def record(self, path: str, seconds: float) -> None:
+        """Record the latency of a path.
+
+        Args:
+            path (str): The name of the path.
+            seconds (float): The latency in seconds.
+        """
+        self._counts[path][bisect_left(self.buckets, seconds * 1000)] += 1
+
+    @property
+    def stats(self) -> dict:
+        """The call count and the non-empty buckets of every path."""
+        labels = [f"≤{b} ms" for b in self.buckets] + [f">{self.buckets[-1]} ms"]
+        return {
+            path: {
+                "count": sum(counts),
+                "buckets": {k: c for k, c in zip(labels, counts) if c},
+            }
+            for path, counts in self._counts.items()
+        }
+
+
+# The time `ImageConverter` takes to resolve each kind of argument.
+image_lookups = LatencyHistogram()
 
 
 class Regex(Enum):
@@ -48,6 +108,37 @@ class Regex(Enum):
     )
 
 
+# Precompiled once, `classify` runs for every image command.
+PATTERNS = {
+    "mention": re.compile(r"<@!?([0-9]{15,20})>|([0-9]{15,20})"),
+    "emoji": re.compile(Regex.EMOJI.value),
+    "url": re.compile(Regex.URL.value),
+}
+
+
+def classify(argument: str) -> str:
+    """Tell what kind of image argument was given, without any request.
+
+    Args:
+        argument (str): The argument of an image command.
+
+    Returns:
+        str: One of "mention" (a member mention or ID), "emoji" (a custom
+        emoji), "url", "unicode" (a unicode emoji) and "name".
+    """
+    for kind in ("mention", "emoji"):
+        if PATTERNS[kind].fullmatch(argument):
+            return kind
+
+    if PATTERNS["url"].match(argument):
+        return "url"
+
+    if emoji_to_url(argument) is not None:
+        return "unicode"
+
+    return "name"
+
+
 class ColorConverter(commands.Converter):
     """The color converter class created to convert string color values.
 
@@ -83,6 +174,8 @@ class ColorConverter(commands.Converter):
 class SettingsConverter(commands.Converter):
     async def convert(self, guild: discord.Guild, settings: dict):
         data = copy(settings[guild.id])
+        # Set by the bot owners only, see the `renderweight` command.
+        data.pop("render_weight", None)
 
         for k, v in data.items():
             if k == "autorole":
@@ -134,68 +227,110 @@ class TimeConverter(commands.Converter):
         return time
 
 
+def avatar_asset(
+    user: discord.abc.User, size: int, *, animated: bool = False
+) -> discord.Asset:
+    """Get the avatar of a user in the format a renderer can take.
+
+    Args:
+        user (discord.abc.User): The user whose avatar to get.
+        size (int): The size of the avatar, a power of 2.
+        animated (bool, optional): Whether the renderer takes animated images,
+            so animated avatars are kept as GIFs. Defaults to False.
+
+    Returns:
+        discord.Asset: The avatar asset, PNG unless animated.
+    """
+    if animated:
+        return user.display_avatar.replace(static_format="png", size=size)
+
+    return user.display_avatar.replace(format="png", size=size)
+
+
 class ImageConverter(commands.Converter):
     """The image converter class created to convert argument into image.
 
+    The argument is classified by `classify` in one pass and sent right
+    to the resolver of its kind, e.g a URL never waits for a member lookup.
+    The time of every conversion is recorded in `image_lookups`.
+
+    Avatars are requested at `size`, which should be the size the image
+    is rendered at, rounded up to a power of 2. Animated avatars stay GIFs
+    if `animated` is set, i.e the renderer filters every frame, and are
+    requested as PNGs of their first frame otherwise.
+
     This class inherits from `commands.Converter`.
     """
 
+    def __init__(self, *, size: int = 512, animated: bool = False):
+        self.size = size
+        self.animated = animated
+
     async def convert(
-        self, ctx, argument: Union[discord.Emoji, str], *, return_url: bool = False
-    ) -> Union[bytes, str]:
+        self, ctx, argument: Optional[str], *, return_url: bool = False
+    ) -> Union[bytes, str, None]:
         """The function that does the actual thing we are expecting from this class.
 
         Parameters
         ----------
         ctx
             The context instance.
-        argument : Union[discord.Emoji, str]
+        argument : Optional[str]
             The argument to convert into an image.
         return_url : bool, optional
             Whether to return URL for the image, by default False
 
         Returns
         -------
-        Union[bytes, str]
+        Union[bytes, str, None]
             We may have a scenario where the user can ask for the image URL,
             i.e str, we expect this, but by default consider returning bytes.
+            None if the argument is not an image.
         """
+        if not argument:
+            return None
+
+        kind = classify(argument)
+        resolve = getattr(self, f"_resolve_{kind}")
+        start = time.perf_counter()
+
         try:
-            mc = commands.MemberConverter()
-            member = await mc.convert(ctx, argument)
-            avatar = member.avatar.replace(static_format="png", format="png", size=512)
-            if return_url:
-                return str(avatar)
-            return await avatar.read()
-
-        except (TypeError, commands.MemberNotFound):
-            try:
-                cs = ctx.bot.session
-                url = await emoji_to_url(argument, session=cs)
-
-                if re.match(Regex.URL, url):
-                    if return_url:
-                        return url
-                    r = await cs.get(url)
-                    image = await r.read()
-                    return image
-
-                if re.match(Regex.URL, argument):
-                    if return_url:
-                        return argument
-                    r = await cs.get(argument)
-                    image = await r.read()
-                    return image
-
-                elif re.match(Regex.EMOJI, argument):
-                    ec = commands.PartialEmojiConverter()
-                    emoji = await ec.convert(ctx, argument)
-                    asset = emoji.url
-                    if return_url:
-                        return str(asset)
-                    return await asset.read()
-
-            except TypeError:
-                return None
-
-        return None
+            return await resolve(ctx, argument, return_url)
+        finally:
+            image_lookups.record(kind, time.perf_counter() - start)
+
+    async def _resolve_member(self, ctx, argument: str, return_url: bool):
+        try:
+            member = await commands.MemberConverter().convert(ctx, argument)
+        except commands.MemberNotFound:
+            return None
+
+        avatar = avatar_asset(member, self.size, animated=self.animated)
+        if return_url:
+            return str(avatar)
+        return await assets.read_asset(avatar)
+
+    # Names may be looked up by the gateway, mentions and IDs by the API.
+    _resolve_name = _resolve_mention = _resolve_member
+
+    async def _resolve_emoji(self, ctx, argument: str, return_url: bool):
+        match = PATTERNS["emoji"].match(argument)
+        asset = discord.PartialEmoji(
+            animated=bool(match["animated"]),
+            name=match["name"],
+            id=int(match["id"]),
+        ).url
+        if return_url:
+            return asset
+        return await assets.read_url(asset, ctx.bot.session)
+
+    async def _resolve_url(self, ctx, argument: str, return_url: bool):
+        if return_url:
+            return argument
+        return await assets.read_url(argument, ctx.bot.session)
+
+    async def _resolve_unicode(self, ctx, argument: str, return_url: bool):
+        url = emoji_to_url(argument)
+        if return_url:
+            return url
+        return await twemojis.read_url(url, ctx.bot.session)
@@ -0,0 +1,323 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+import discord
+
+from boribay.settings import (
+    ASSET_CACHE_DISK_MAX_BYTES,
+    ASSET_CACHE_MAX_BYTES,
+    ASSET_CACHE_PATH,
+    DOWNLOAD_MAX_BYTES,
+    DOWNLOAD_TIMEOUT,
+    TWEMOJI_CACHE_DISK_MAX_BYTES,
+    TWEMOJI_CACHE_MAX_BYTES,
+    TWEMOJI_CACHE_PATH,
+)
+
+from ..exceptions import BadDownload
+
+__all__ = ("AssetCache", "assets", "download_image", "twemojis")
+
+# The leading bytes of the image formats the renderers can decode.
+SIGNATURES = (
+    b"\x89PNG\r\n\x1a\n",
+    b"\xff\xd8\xff",
+    b"GIF87a",
+    b"GIF89a",
+    b"BM",
+    b"II*\x00",
+    b"MM\x00*",
+)
+
+
+def is_image(head: bytes) -> bool:
+    """Sniff whether the first bytes of a file are of a supported image."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return True
+
+    return head.startswith(SIGNATURES)
+
+
+async def download_image(
+    url: str,
+    session,
+    *,
+    max_bytes: int = DOWNLOAD_MAX_BYTES,
+    timeout: float = DOWNLOAD_TIMEOUT,
+) -> bytes:
+    """Download an image, giving up as soon as it cannot be a usable one.
+
+    The body is streamed, so the download is aborted once it goes over
+    `max_bytes`, or right after the first chunk if that is not an image.
+    The whole download, headers included, has to finish in `timeout`.
+
+    Args:
+        url (str): The URL of the image.
+        session (aiohttp.ClientSession): The session to download with.
+        max_bytes (int, optional): The largest allowed size.
+        timeout (float, optional): The deadline in seconds.
+
+    Raises:
+        BadDownload: If the image is unreachable, too large, too slow
+        or not an image at all.
+
+    Returns:
+        bytes: The image.
+    """
+    try:
+        return await asyncio.wait_for(_stream(url, session, max_bytes), timeout)
+    except asyncio.TimeoutError:
+        raise BadDownload("The image took too long to download.")
+    except aiohttp.ClientError:
+        raise BadDownload("Could not download the image from this URL.")
+
+
+async def _stream(url: str, session, max_bytes: int) -> bytes:
+    async with session.get(url) as r:
+        if r.status != 200:
+            raise BadDownload(f"The URL responded with {r.status}, not an image.")
+
+        if r.content_type not in ("application/octet-stream", "") and not (
+            r.content_type.startswith("image/")
+        ):
+            raise BadDownload("The URL does not lead to an image.")
+
+        if (r.content_length or 0) > max_bytes:
+            raise BadDownload("The image is too large to download.")
+
+        chunks = []
+        size = 0
+        head = b""
+
+        async for chunk in r.content.iter_chunked(64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+
+            if size > max_bytes:
+                raise BadDownload("The image is too large to download.")
+
+            if len(head) < 12:
+                head += chunk[:12]
+
+                if len(head) >= 12 and not is_image(head):
+                    raise BadDownload("The URL does not lead to an image.")
+
+        if not is_image(head):
+            raise BadDownload("The URL does not lead to an image.")
+
+        # A single chunk is returned as it is, without copying.
+        return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+
+class AssetCache:
+    """The cache of downloaded images, shared by all image commands.
+
+    Entries are keyed by their URL. Discord asset URLs contain both the
+    asset hash and the requested size, so a changed avatar is a new key.
+
+    Recently used entries are kept in memory under a byte budget, and
+    optionally on disk, in the `path` folder, under the `max_disk_bytes`
+    budget. Reads touch the files, so the disk tier evicts the least
+    recently used ones by their modification time. Concurrent requests
+    of the same key share a single download.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int = 64 * 1024 ** 2,
+        path: Optional[str] = None,
+        max_disk_bytes: int = 512 * 1024 ** 2,
+    ):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self.size = 0
+        # Unknown until the folder gets scanned on the first write.
+        self.disk_size: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._downloads: Dict[str, asyncio.Task] = {}
+        # Writes run in threads, the size accounting must not interleave.
+        self._disk_lock = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        """Size and hit/miss counters of the cache."""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "bytes": self.size,
+            "disk_bytes": self.disk_size or 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    async def get(self, key: str, download: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Get the cached data of a key, downloading it on a miss.
+
+        Args:
+            key (str): The key of the data, i.e its URL.
+            download (Callable[[], Awaitable[bytes]]): Downloads the data.
+
+        Returns:
+            bytes: The downloaded data.
+        """
+        if (data := self._memory.get(key)) is not None:
+            self.hits += 1
+            self._memory.move_to_end(key)
+            return data
+
+        if (task := self._downloads.get(key)) is None:
+            self.misses += 1
+            task = asyncio.create_task(self._load(key, download))
+            self._downloads[key] = task
+            task.add_done_callback(lambda _: self._downloads.pop(key, None))
+        else:
+            self.hits += 1
+
+        # Shielded, so one cancelled command does not break the others waiting.
+        return await asyncio.shield(task)
+
+    async def read_asset(self, asset: discord.Asset) -> bytes:
+        """Read a Discord asset, e.g an avatar or an emoji, through the cache.
+
+        Args:
+            asset (discord.Asset): The asset to read.
+
+        Returns:
+            bytes: The asset data.
+        """
+        return await self.get(asset.url, asset.read)
+
+    async def read_url(self, url: str, session) -> bytes:
+        """Download an image URL through the cache, see `download_image`.
+
+        Args:
+            url (str): The URL to download.
+            session (aiohttp.ClientSession): The session to download with.
+
+        Returns:
+            bytes: The image.
+        """
+        return await self.get(url, lambda: download_image(url, session))
+
+    async def _load(self, key: str, download: Callable[[], Awaitable[bytes]]) -> bytes:
+        filename = None
+
+        if self.path is not None:
+            digest = hashlib.sha256(key.encode()).hexdigest()
+            filename = os.path.join(self.path, digest)
+
+            data = await asyncio.to_thread(self._read_file, filename)
+
+            if data is not None:
+                self._remember(key, data)
+                return data
+
+        data = await download()
+        self._remember(key, data)
+
+        if filename is not None:
+            await asyncio.to_thread(self._write_file, filename, data)
+
+        return data
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        if (previous := self._memory.pop(key, None)) is not None:
+            self.size -= len(previous)
+
+        self._memory[key] = data
+        self.size += len(data)
+
+        while self.size > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self.size -= len(evicted)
+
+    @staticmethod
+    def _read_file(filename: str) -> Optional[bytes]:
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Marking the file as recently used, it may be evicted meanwhile.
+        with suppress(OSError):
+            os.utime(filename)
+
+        return data
+
+    def _write_file(self, filename: str, data: bytes) -> None:
+        # Created on the first write, so importing this module (e.g in the
+        # render workers) never creates folders in the working directory.
+        os.makedirs(self.path, exist_ok=True)
+
+        # Writing into a temporary file first to never leave a partial one.
+        with open(f"{filename}.tmp", "wb") as f:
+            f.write(data)
+
+        os.replace(f"{filename}.tmp", filename)
+
+        with self._disk_lock:
+            if self.disk_size is None:
+                self.disk_size = sum(size for _, size, _ in self._disk_files())
+            else:
+                self.disk_size += len(data)
+
+            if self.disk_size > self.max_disk_bytes:
+                self._trim_disk()
+
+    def _disk_files(self) -> List[Tuple[float, int, str]]:
+        files = []
+
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                # Skipping the files that are being written.
+                if entry.name.endswith(".tmp"):
+                    continue
+
+                with suppress(FileNotFoundError):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return files
+
+    def _trim_disk(self) -> None:
+        # Going a tenth under the budget, so not every next write rescans.
+        target = self.max_disk_bytes * 9 // 10
+        files = sorted(self._disk_files())
+        self.disk_size = sum(size for _, size, _ in files)
+
+        for _, size, filename in files:
+            if self.disk_size <= target:
+                break
+
+            with suppress(FileNotFoundError):
+                os.remove(filename)
+
+            self.disk_size -= size
+
+
+assets = AssetCache(
+    max_bytes=ASSET_CACHE_MAX_BYTES,
+    path=ASSET_CACHE_PATH,
+    max_disk_bytes=ASSET_CACHE_DISK_MAX_BYTES,
+)
+# Twemoji images are few and never change, so they are always kept on disk.
+twemojis = AssetCache(
+    max_bytes=TWEMOJI_CACHE_MAX_BYTES,
+    path=TWEMOJI_CACHE_PATH,
+    max_disk_bytes=TWEMOJI_CACHE_DISK_MAX_BYTES,
+)
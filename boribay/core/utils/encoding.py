@@ -0,0 +1,199 @@
+from collections import defaultdict
+from io import BytesIO
+from time import perf_counter
+from typing import Optional, Tuple
+
+import discord
+from PIL import Image
+
+from boribay.settings import RENDER_BYTE_BUDGET
+
+__all__ = ("encode", "extension", "image_file", "EncoderStats", "encoder_stats")
+
+FORMATS = ("auto", "png", "jpeg", "webp")
+
+# Lossy qualities tried in order until the output fits in the byte budget.
+QUALITIES = (85, 70, 55, 40)
+
+
+def _choose(image: Image.Image) -> str:
+    """Choose the format for the "auto" mode.
+
+    Images with transparency or a few colours, i.e text and flat
+    templates, stay PNG. Anything photographic becomes a JPEG.
+    """
+    if "A" in image.getbands() or "transparency" in image.info:
+        return "png"
+
+    # getcolors stops counting as soon as there are more than `maxcolors`.
+    return "png" if image.getcolors(256) else "jpeg"
+
+
+def _save(image: Image.Image, fmt: str, quality: int) -> BytesIO:
+    buffer = BytesIO()
+
+    if fmt == "png":
+        # The fast zlib level, `optimize` costs 10-20 times more for ~15%.
+        image.save(buffer, "png", compress_level=1)
+
+    elif fmt == "jpeg":
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        image.save(buffer, "jpeg", quality=quality)
+
+    else:
+        image.save(buffer, "webp", quality=quality, method=0)
+
+    return buffer
+
+
+def _save_wand(image, fmt: str, quality: int) -> BytesIO:
+    buffer = BytesIO()
+    image.format = fmt
+    # For PNG the tens digit is the zlib level and the ones is the filter.
+    image.compression_quality = 15 if fmt == "png" else quality
+    image.save(file=buffer)
+    return buffer
+
+
+def encode(
+    image, fmt: str = "png", *, budget: Optional[int] = RENDER_BYTE_BUDGET
+) -> BytesIO:
+    """Encode a rendered image into one of the upload formats.
+
+    Lossy formats step their quality down until the output fits into
+    the budget or the lowest quality is reached. A PNG that does not fit
+    is re-encoded as a lossy image.
+
+    The format and the encoding time are attached to the buffer as the
+    `encoding` attribute, for the render engine to record them.
+
+    Args:
+        image (Union[Image.Image, wand.image.Image]): The image to encode.
+        fmt (str, optional): One of "auto", "png", "jpeg" and "webp".
+        Defaults to "png".
+        budget (Optional[int], optional): The maximum size of the output
+        in bytes, None to not limit it. Defaults to `RENDER_BYTE_BUDGET`.
+
+    Raises:
+        ValueError: If an unknown format was given.
+
+    Returns:
+        BytesIO: The encoded image, rewound to the start.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown image format: {fmt}")
+
+    start = perf_counter()
+
+    if isinstance(image, Image.Image):
+        save = _save
+        if fmt == "auto":
+            fmt = _choose(image)
+        alpha = "A" in image.getbands()
+
+    else:
+        save = _save_wand
+        # Animated images keep their own format, e.g GIF avatars.
+        if len(image.sequence) > 1:
+            fmt = image.format.lower()
+        elif fmt == "auto":
+            fmt = "png" if image.alpha_channel or image.colors <= 256 else "jpeg"
+        alpha = bool(image.alpha_channel)
+
+    buffer = save(image, fmt, QUALITIES[0])
+
+    if budget is not None and len(buffer.getbuffer()) > budget:
+        if fmt == "png":
+            fmt = "webp" if alpha else "jpeg"
+
+        if fmt in ("jpeg", "webp"):
+            for quality in QUALITIES:
+                buffer = save(image, fmt, quality)
+
+                if len(buffer.getbuffer()) <= budget:
+                    break
+
+    buffer.encoding = (fmt, perf_counter() - start)
+    buffer.seek(0)
+    return buffer
+
+
+def extension(data: bytes) -> str:
+    """Get the file extension of an encoded image by its magic bytes.
+
+    Args:
+        data (bytes): The encoded image, only the header is needed.
+
+    Returns:
+        str: The extension, "png" if the format is unknown.
+    """
+    if data.startswith(b"\xff\xd8"):
+        return "jpg"
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+
+    if data.startswith(b"GIF8"):
+        return "gif"
+
+    return "png"
+
+
+def image_file(data: bytes, name: str) -> discord.File:
+    """Make a file to upload from a rendered image.
+
+    Args:
+        data (bytes): The rendered image.
+        name (str): The file name without an extension.
+
+    Returns:
+        discord.File: The file named with the extension of the image format.
+    """
+    return discord.File(BytesIO(data), f"{name}.{extension(data[:12])}")
+
+
+class EncoderStats:
+    """Encoding time and output size counters of every renderer."""
+
+    def __init__(self):
+        self._stats = defaultdict(
+            lambda: {
+                "count": 0,
+                "seconds": 0.0,
+                "bytes": 0,
+                "formats": defaultdict(int),
+            }
+        )
+
+    def record(self, name: str, encoding: Tuple[str, float], size: int) -> None:
+        """Record an encoded output of a renderer.
+
+        Args:
+            name (str): The qualified name of the renderer.
+            encoding (Tuple[str, float]): The format and the encoding time.
+            size (int): The output size in bytes.
+        """
+        fmt, seconds = encoding
+        stats = self._stats[name]
+        stats["count"] += 1
+        stats["seconds"] += seconds
+        stats["bytes"] += size
+        stats["formats"][fmt] += 1
+
+    @property
+    def stats(self) -> dict:
+        """Average encoding time and output size per renderer."""
+        return {
+            name: {
+                "count": s["count"],
+                "avg_ms": round(1000 * s["seconds"] / s["count"], 2),
+                "avg_kb": round(s["bytes"] / s["count"] / 1024, 1),
+                "formats": dict(s["formats"]),
+            }
+            for name, s in self._stats.items()
+        }
+
+
+encoder_stats = EncoderStats()
@@ -0,0 +1,298 @@
+import functools
+import inspect
+from collections import defaultdict
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from wand.image import Image as WI
+
+from boribay.settings import FILTER_BACKEND
+
+from .layouts import layouts
+from .templates import templates
+
+__all__ = ("FILTERS", "frame_filter", "parse_chain", "split_image", "use_backend")
+
+BACKENDS = ("numpy", "pillow", "wand")
+
+# The most stages a filter chain may have.
+MAX_STAGES = 5
+
+# The filters that work on a single decoded frame, by their names.
+FILTERS: Dict[str, Callable[..., Image.Image]] = {}
+_implementations: Dict[str, Dict[str, Callable]] = defaultdict(dict)
+
+# The active backend, "wand" keeps the ImageMagick renderers of `Manip`.
+backend = FILTER_BACKEND
+
+
+def frame_filter(name: str, *, backend: str = "pillow"):
+    """Register a function as a frame filter.
+
+    A frame filter takes a Pillow image, with optional keyword parameters,
+    and returns the filtered image. Filters are applied frame by frame to
+    animated images, so they should not keep any state between calls.
+
+    The "pillow" implementation is the fallback of every other backend.
+
+    Args:
+        name (str): The name of the filter.
+        backend (str, optional): The backend of the implementation.
+        Defaults to "pillow".
+    """
+
+    def decorator(func: Callable[..., Image.Image]):
+        _implementations[backend][name] = func
+        return func
+
+    return decorator
+
+
+def use_backend(name: str) -> None:
+    """Switch the filter implementations to another backend.
+
+    Args:
+        name (str): One of "numpy", "pillow" and "wand".
+
+    Raises:
+        ValueError: If an unknown backend was given.
+    """
+    global backend
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown filter backend: {name}")
+
+    backend = name
+    FILTERS.clear()
+    FILTERS.update(_implementations["pillow"])
+    FILTERS.update(_implementations[name])
+
+
+def _parameters(func: Callable) -> List[inspect.Parameter]:
+    """The keyword-only parameters of a filter, which users may give."""
+    bound = getattr(func, "keywords", {})
+    return [
+        p
+        for p in inspect.signature(func).parameters.values()
+        if p.kind is p.KEYWORD_ONLY and p.name not in bound
+    ]
+
+
+def split_image(argument: str) -> Tuple[Optional[str], str]:
+    """Split the optional image argument off a filter chain.
+
+    The first word is the image, unless the first stage of the chain
+    starts with a filter name, e.g `jail|pixelate` has no image.
+
+    Args:
+        argument (str): An optional image followed by the filter chain.
+
+    Returns:
+        Tuple[Optional[str], str]: The image, None if not given, and the chain.
+    """
+    image, _, rest = argument.partition(" ")
+
+    if image.split("|")[0].lower() in FILTERS:
+        return None, argument
+
+    return image, rest
+
+
+def parse_chain(chain: str) -> List[Tuple[str, dict]]:
+    """Parse a filter chain, e.g `pixelate | swirl 120 | jail`.
+
+    Filter arguments are given after the filter name, in the order of
+    its keyword-only parameters.
+
+    Args:
+        chain (str): The filter chain.
+
+    Raises:
+        ValueError: If the chain is invalid, with a user-friendly message.
+
+    Returns:
+        List[Tuple[str, dict]]: The filter names with their parameters.
+    """
+    stages = []
+
+    for stage in chain.split("|"):
+        if not (tokens := stage.split()):
+            raise ValueError("The filter chain has an empty stage.")
+
+        name, *tokens = tokens
+        name = name.lower()
+
+        if name not in FILTERS or name == "pipe":
+            raise ValueError(
+                f"Unknown filter `{name}`. Available ones are: "
+                + ", ".join(f for f in FILTERS if f != "pipe")
+            )
+
+        params = _parameters(FILTERS[name])
+
+        if len(tokens) > len(params):
+            raise ValueError(f"Too many arguments for `{name}`.")
+
+        values = {}
+
+        for param, token in zip(params, tokens):
+            try:
+                values[param.name] = param.annotation(token)
+            except ValueError:
+                raise ValueError(f"`{token}` is not a valid {param.name} for `{name}`.")
+
+        for param in params[len(tokens) :]:
+            if param.default is param.empty:
+                raise ValueError(f"`{name}` needs the {param.name} argument.")
+
+        stages.append((name, values))
+
+    if len(stages) > MAX_STAGES:
+        raise ValueError(f"A filter chain can have up to {MAX_STAGES} stages.")
+
+    return stages
+
+
+@functools.lru_cache(maxsize=32)
+def _overlay(name: str, size: Tuple[int, int], opacity: float) -> Image.Image:
+    overlay = layouts.image(name, copy=False).convert("RGBA").resize(size)
+    overlay.putalpha(overlay.getchannel("A").point(lambda a: round(a * opacity)))
+    return overlay
+
+
+@functools.lru_cache(maxsize=32)
+def _overlay_array(
+    name: str, size: Tuple[int, int], opacity: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    overlay = np.asarray(_overlay(name, size, opacity), dtype=np.uint16)
+    alpha = overlay[..., 3:]
+    # Premultiplied once per size, blending is then a multiply and an add.
+    return overlay[..., :3] * alpha, 255 - alpha
+
+
+def blend(frame: Image.Image, name: str, opacity: float) -> Image.Image:
+    """Put a layout over a frame, stretched to the frame size.
+
+    Args:
+        frame (Image.Image): The frame to put the layout on.
+        name (str): The path of the layout relative to the layouts folder.
+        opacity (float): The opacity of the layout, from 0 to 1.
+
+    Returns:
+        Image.Image: The blended frame.
+    """
+    return Image.alpha_composite(
+        frame.convert("RGBA"), _overlay(name, frame.size, opacity)
+    )
+
+
+def blend_array(frame: Image.Image, name: str, opacity: float) -> Image.Image:
+    """The NumPy implementation of `blend`, keeps the mode of the frame."""
+    if frame.mode not in ("RGB", "RGBA"):
+        frame = frame.convert("RGBA")
+
+    # Pillow 9 exports the pixels as a copy anyway, so it is the writable one.
+    pixels = np.array(frame)
+
+    if frame.mode == "RGBA":
+        overlay = np.asarray(_overlay(name, frame.size, opacity))
+        return Image.fromarray(_alpha_composite(pixels, overlay), "RGBA")
+
+    color, inverse = _overlay_array(name, frame.size, opacity)
+    # Never overflows 16 bits, since the two weights add up to 255.
+    pixels[..., :3] = (pixels[..., :3] * inverse + color + 127) // 255
+    return Image.fromarray(pixels, frame.mode)
+
+
+def _alpha_composite(pixels: np.ndarray, overlay: np.ndarray) -> np.ndarray:
+    # The integer arithmetic of `Image.alpha_composite`, so the output
+    # is the same, transparent areas of the frame included.
+    src_a = overlay[..., 3:].astype(np.uint32)
+    dst_a = pixels[..., 3:].astype(np.uint32)
+    out_a = src_a * 255 + dst_a * (255 - src_a)
+    src_weight = src_a * (255 * 255 << 7) // np.maximum(out_a, 1)
+    color = overlay[..., :3] * src_weight
+    color += pixels[..., :3] * ((255 << 7) - src_weight) + (0x80 << 7)
+    pixels[..., :3] = ((color >> 8) + color) >> 15
+    out_a += 0x80
+    pixels[..., 3:] = ((out_a >> 8) + out_a) >> 8
+    return pixels
+
+
+@frame_filter("pixelate")
+def pixelate(frame: Image.Image, *, size: int = 32) -> Image.Image:
+    size = max(2, min(256, size))
+    small = frame.resize((size, size), resample=Image.BILINEAR)
+    return small.resize(frame.size, Image.NEAREST)
+
+
+@frame_filter("pixelate", backend="numpy")
+def pixelate_array(frame: Image.Image, *, size: int = 32) -> Image.Image:
+    if frame.mode not in ("RGB", "RGBA", "L"):
+        frame = frame.convert("RGBA")
+
+    size = max(2, min(256, size))
+    # Premultiplied like Pillow resamples it, transparent pixels add no colour.
+    mode = "RGBa" if frame.mode == "RGBA" else frame.mode
+    pixels = np.asarray(frame.convert(mode) if mode != frame.mode else frame)
+    height, width = pixels.shape[:2]
+
+    # Every block takes the mean colour of its pixels, the blocks split
+    # the frame the way `Image.resize` does.
+    rows = np.arange(size) * height // size
+    cols = np.arange(size) * width // size
+    sums = np.add.reduceat(pixels.astype(np.uint32), rows, axis=0)
+    sums = np.add.reduceat(sums, cols, axis=1)
+    counts = np.outer(np.diff(rows, append=height), np.diff(cols, append=width))
+
+    if pixels.ndim == 3:
+        counts = counts[..., None]
+
+    blocks = ((sums + counts // 2) // counts).astype(np.uint8)
+    # The block of every pixel, as `Image.NEAREST` picks it.
+    ys = (2 * np.arange(height) + 1) * size // (2 * height)
+    xs = (2 * np.arange(width) + 1) * size // (2 * width)
+    image = Image.fromarray(blocks.take(ys, axis=0).take(xs, axis=1), mode)
+    return image.convert(frame.mode) if mode != frame.mode else image
+
+
+@frame_filter("swirl")
+def swirl(frame: Image.Image, *, degree: int) -> Image.Image:
+    degree = max(-360, min(360, degree))
+    buffer = BytesIO()
+    frame.save(buffer, "png", compress_level=0)
+
+    with WI(blob=buffer.getvalue()) as img:
+        img.swirl(degree=degree)
+        return Image.open(BytesIO(img.make_blob("png")))
+
+
+@frame_filter("wanted")
+def wanted(frame: Image.Image) -> Image.Image:
+    return templates["wanted"].render({"image": frame})
+
+
+@frame_filter("pipe")
+def pipe(frame: Image.Image, *, chain: str) -> Image.Image:
+    for name, params in parse_chain(chain):
+        frame = FILTERS[name](frame, **params)
+
+    return frame
+
+
+# The layouts put over the frames, with their opacities.
+OVERLAYS = {
+    "jail": ("jailbars.png", 0.7),
+    "rainbow": ("rainbow.png", 0.5),
+    "communist": ("communist-flag.jpg", 0.3),
+}
+
+for _name, (_layout, _opacity) in OVERLAYS.items():
+    frame_filter(_name)(functools.partial(blend, name=_layout, opacity=_opacity))
+    frame_filter(_name, backend="numpy")(
+        functools.partial(blend_array, name=_layout, opacity=_opacity)
+    )
+
+use_backend(FILTER_BACKEND)
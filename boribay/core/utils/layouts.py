@@ -0,0 +1,194 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, Iterable, Tuple
+
+from PIL import Image, ImageFont
+from wand.image import Image as WI
+
+__all__ = ("LayoutRegistry", "layouts")
+
+FONT_PATH = "./data/fonts"
+IMAGE_PATH = "./data/layouts"
+
+logger = logging.getLogger("bot.layouts")
+
+
+class LayoutRegistry:
+    """The registry of decoded layouts and fonts used by `Manip`.
+
+    Every file gets read and decoded once per process, the renderers
+    then receive cheap copies instead of opening the files every time.
+
+    Overlays resized to the input image size are kept as well, up to
+    `max_overlays` of them, since most inputs are avatars of a few sizes.
+    They are only cloned and evicted under a lock, so with the thread
+    backend an eviction never closes an overlay that is being cloned.
+    """
+
+    def __init__(
+        self,
+        image_path: str = IMAGE_PATH,
+        font_path: str = FONT_PATH,
+        *,
+        max_overlays: int = 32,
+    ):
+        self.image_path = image_path
+        self.font_path = font_path
+        self.max_overlays = max_overlays
+        self._images: Dict[str, Image.Image] = {}
+        self._wand: Dict[str, WI] = {}
+        self._overlays: "OrderedDict[Tuple[str, int, int], WI]" = OrderedDict()
+        self._overlay_lock = threading.Lock()
+        self._font_files: Dict[str, bytes] = {}
+        self._fonts: Dict[Tuple[str, int], ImageFont.FreeTypeFont] = {}
+
+    def warm_up(self, *, wand: Iterable[str] = ()) -> None:
+        """Decode every layout and read every font file in advance.
+
+        Args:
+            wand (Iterable[str], optional): Layouts to decode for Wand as well.
+        """
+        for name in self._walk(self.image_path):
+            # The templates folder has the JSON descriptions of the templates.
+            if not name.endswith(".json"):
+                self._image(name)
+
+        for name in self._walk(self.font_path):
+            self._font_file(name)
+
+        for name in wand:
+            self._wand_image(name)
+
+        logger.info(
+            f"Loaded {len(self._images)} layouts and {len(self._font_files)} fonts "
+            f"({self.memory_usage / 1024 ** 2:.1f} MB)."
+        )
+
+    @property
+    def memory_usage(self) -> int:
+        """Approximate amount of memory the registry takes, in bytes."""
+        images = sum(
+            len(im.getbands()) * im.width * im.height for im in self._images.values()
+        )
+
+        with self._overlay_lock:
+            wand = sum(
+                4 * (im.depth // 8) * im.width * im.height
+                for im in (*self._wand.values(), *self._overlays.values())
+            )
+
+        fonts = sum(len(data) for data in self._font_files.values())
+        return images + wand + fonts
+
+    def image(self, name: str, *, copy: bool = True) -> Image.Image:
+        """Get a copy of a decoded layout.
+
+        Args:
+            name (str): The path of the layout relative to the layouts folder.
+            copy (bool, optional): Whether to copy the layout. Pass False
+            when it is only read, e.g pasted somewhere. Defaults to True.
+
+        Returns:
+            Image.Image: The copy, free to be changed by the caller.
+        """
+        image = self._image(name)
+        return image.copy() if copy else image
+
+    def wand(self, name: str) -> WI:
+        """Get a copy of a layout decoded by Wand.
+
+        Args:
+            name (str): The path of the layout relative to the layouts folder.
+
+        Returns:
+            WI: The copy, free to be changed by the caller.
+        """
+        return self._wand_image(name).clone()
+
+    def overlay(self, name: str, width: int, height: int) -> WI:
+        """Get a copy of a Wand layout resized to the given size.
+
+        The layout is resampled once per size, later calls for the same
+        size only copy the cached result.
+
+        Args:
+            name (str): The path of the layout relative to the layouts folder.
+            width (int): The width to resize to.
+            height (int): The height to resize to.
+
+        Returns:
+            WI: The copy, free to be changed by the caller.
+        """
+        key = (name, width, height)
+
+        with self._overlay_lock:
+            if (overlay := self._overlays.get(key)) is not None:
+                self._overlays.move_to_end(key)
+                return overlay.clone()
+
+        # Resampled outside of the lock, it is the slow part.
+        overlay = self.wand(name)
+        overlay.resize(width, height)
+
+        with self._overlay_lock:
+            # Another thread may have cached the same size meanwhile.
+            if (previous := self._overlays.pop(key, None)) is not None:
+                previous.close()
+
+            self._overlays[key] = overlay
+
+            while len(self._overlays) > self.max_overlays:
+                _, evicted = self._overlays.popitem(last=False)
+                evicted.close()
+
+            return overlay.clone()
+
+    def font(self, name: str, size: int) -> ImageFont.FreeTypeFont:
+        """Get a font of the given size, parsed once per size.
+
+        Args:
+            name (str): The file name of the font.
+            size (int): The font size.
+
+        Returns:
+            ImageFont.FreeTypeFont: The shared font object.
+        """
+        if (font := self._fonts.get((name, size))) is None:
+            font = ImageFont.truetype(BytesIO(self._font_file(name)), size)
+            self._fonts[name, size] = font
+
+        return font
+
+    @staticmethod
+    def _walk(path: str) -> Iterable[str]:
+        for root, _, files in os.walk(path):
+            for file in files:
+                yield os.path.relpath(os.path.join(root, file), path)
+
+    def _image(self, name: str) -> Image.Image:
+        if (image := self._images.get(name)) is None:
+            image = Image.open(os.path.join(self.image_path, name))
+            image.load()
+            self._images[name] = image
+
+        return image
+
+    def _wand_image(self, name: str) -> WI:
+        if (image := self._wand.get(name)) is None:
+            image = WI(filename=os.path.join(self.image_path, name))
+            self._wand[name] = image
+
+        return image
+
+    def _font_file(self, name: str) -> bytes:
+        if (data := self._font_files.get(name)) is None:
+            with open(os.path.join(self.font_path, name), "rb") as f:
+                data = self._font_files[name] = f.read()
+
+        return data
+
+
+layouts = LayoutRegistry()
@@ -1,34 +1,119 @@
-import asyncio
 import functools
+import inspect
 import textwrap
 from io import BytesIO
-from typing import Union
+from typing import List, Optional, Tuple, Union
 
-from PIL import Image, ImageColor, ImageDraw, ImageFont
+from discord.ext import commands
+from PIL import Image, ImageColor, ImageDraw
 from wand.image import Image as WI
 
-from .converters import ImageConverter
+from boribay.settings import RENDER_MAX_PIXELS
 
-FONT_PATH = "./data/fonts"
-IMAGE_PATH = "./data/layouts"
+from . import filters
+from .animation import animate, is_animated
+from .converters import ImageConverter, avatar_asset
+from .downloads import assets
+from .encoding import encode
+from .layouts import layouts
+from .rendering import render_cache, render_engine
+from .templates import templates
+
+# Makes Pillow refuse to decode anything far over the budget in the workers.
+Image.MAX_IMAGE_PIXELS = RENDER_MAX_PIXELS
 
 
 def executor(func):
     """Wraps a sync function into an async function.
 
-    This provides us non-blocking wrapped functions.
+    This provides us non-blocking wrapped functions, which are run
+    by the render engine, in a worker process by default.
+
+    The wrapper takes images as bytes and returns the output as bytes,
+    only the wrapped function gets them as `BytesIO` in the worker.
     """
 
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
         """Sync function wrapper."""
-        loop = asyncio.get_event_loop()
-        partial_function = functools.partial(func, *args, **kwargs)
-        return await loop.run_in_executor(None, partial_function)
+        return await render_engine.run(func, *args, **kwargs)
+
+    return wrapper
+
+
+def cached(func):
+    """Caches the output of a renderer that is a pure function of its inputs.
+
+    A repeated call then skips decoding, rendering and encoding at all.
+    """
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = render_cache.make_key(name, args, kwargs)
+
+        if (output := render_cache.get(key)) is None:
+            output = await func(*args, **kwargs)
+            render_cache.put(key, output)
+
+        return output
 
     return wrapper
 
 
+def apply_filter(name: str, image: BytesIO, fmt: str, **params) -> BytesIO:
+    """Render a still image with one of the frame filters.
+
+    Args:
+        name (str): The name of the frame filter.
+        image (BytesIO): The input image.
+        fmt (str): The output format, see `encode`.
+
+    Returns:
+        BytesIO: The encoded output.
+    """
+    with open_image(image, (512, 512)) as im:
+        return encode(filters.FILTERS[name](im, **params), fmt)
+
+
+def animated(name: str):
+    """Sends animated inputs of a renderer to the frame filter of the same name.
+
+    The still image renderer is used otherwise. The `image` argument is
+    the input, the rest of the arguments but `fmt` are filter parameters.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            params = signature.bind(*args, **kwargs).arguments
+            image = params.pop("image")
+            params.pop("fmt", None)
+
+            if is_animated(image):
+                return await animate(name, image, **params)
+
+            return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def warm_up() -> None:
+    """The render engine hook to preload the layouts in every worker."""
+    if filters.backend == "wand":
+        layouts.warm_up(
+            wand=("jailbars.png", "f.png", "rainbow.png", "communist-flag.jpg")
+        )
+    else:
+        layouts.warm_up(wand=("f.png",))
+
+    templates.warm_up()
+
+
 def color_exists(color: str) -> bool:
     """Checking whether the given color exists is important in some commands.
 
@@ -47,275 +132,324 @@ def color_exists(color: str) -> bool:
         return False
 
 
+def check_image(data: bytes) -> None:
+    """Reject an input image before it gets decoded.
+
+    Only the image header is read, so a decompression bomb costs nothing.
+
+    Args:
+        data (bytes): The input image.
+
+    Raises:
+        commands.BadArgument: If the data is not an image or if it has
+        more pixels than the `RENDER_MAX_PIXELS` budget.
+    """
+    try:
+        with Image.open(BytesIO(data)) as im:
+            width, height = im.size
+    except Image.DecompressionBombError:
+        width = height = RENDER_MAX_PIXELS
+    except Image.UnidentifiedImageError:
+        raise commands.BadArgument("The given file is not an image.")
+
+    if width * height > RENDER_MAX_PIXELS:
+        raise commands.BadArgument("The image is too large to process.")
+
+
+def open_image(image: BytesIO, size: Tuple[int, int]) -> Image.Image:
+    """Decode an input image downscaled to fit the working size of a template.
+
+    JPEGs get decoded right at a reduced scale by `Image.draft`, which
+    `thumbnail` does itself, so a huge photo never gets decoded fully.
+
+    Args:
+        image (BytesIO): The input image.
+        size (Tuple[int, int]): The largest size the renderer needs.
+
+    Returns:
+        Image.Image: The decoded image, not larger than the given size.
+    """
+    im = Image.open(image)
+    im.thumbnail(size)
+    return im
+
+
+def open_wand(image: BytesIO, size: Tuple[int, int]) -> WI:
+    """The `open_image` counterpart for the Wand renderers.
+
+    Only the first frame of an animated image is kept, the renderers that
+    take every frame get them through `animated`. So ImageMagick never
+    decodes a many-frame GIF, nor a frame larger than the working size.
+
+    Args:
+        image (BytesIO): The input image.
+        size (Tuple[int, int]): The largest size the renderer needs.
+
+    Returns:
+        WI: The decoded still image, not larger than the given size.
+    """
+    with Image.open(image) as im:
+        if not getattr(im, "is_animated", False) and (
+            im.width <= size[0] and im.height <= size[1]
+        ):
+            image.seek(0)
+            return WI(file=image)
+
+        im.thumbnail(size)
+
+        if im.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            im = im.convert("RGBA")
+
+        buffer = BytesIO()
+        im.save(buffer, "png", compress_level=0)
+
+    return WI(blob=buffer.getvalue())
+
+
 async def make_image(
-    ctx, argument: str, *, return_url: bool = False
+    ctx,
+    argument: str,
+    *,
+    return_url: bool = False,
+    size: int = 512,
+    animated: bool = False,
 ) -> Union[bytes, str]:
-    converter = ImageConverter()
+    converter = ImageConverter(size=size, animated=animated)
     image = await converter.convert(ctx, argument, return_url=return_url)
 
     if not image:
         if ctx.message.attachments:
             attachment = ctx.message.attachments[0]
-            image = attachment.url if return_url else await attachment.read()
+            if return_url:
+                return attachment.url
+            image = await assets.get(attachment.url, attachment.read)
         else:
-            avatar = ctx.author.avatar.replace(
-                static_format="png", format="png", size=512
-            )
-            image = str(avatar) if return_url else await avatar.read()
+            avatar = avatar_asset(ctx.author, size, animated=animated)
+            image = str(avatar) if return_url else await assets.read_asset(avatar)
+
+    if not return_url:
+        check_image(image)
 
     return image
 
 
 class Manip:
-    """A set of static methods used in the Image extension."""
+    """A set of static methods used in the Image extension.
+
+    Renderers take the input images as bytes and return the encoded
+    output as bytes, which are never copied on the way to the workers
+    and back. Every renderer takes the keyword-only `fmt` of its output,
+    the default of which suits its template, see `encode` for the options.
+    """
 
     @staticmethod
     @executor
-    def typeracer(txt: str):
-        font = ImageFont.truetype(f"{FONT_PATH}/monoid.ttf", size=30)
+    def typeracer(txt: str, *, fmt: str = "png"):
+        font = layouts.font("monoid.ttf", 30)
         w, h = font.getsize_multiline(txt)
 
         with Image.new("RGB", (w + 10, h + 10)) as base:
             canvas = ImageDraw.Draw(base)
             canvas.multiline_text((5, 5), txt, font=font)
-            buffer = BytesIO()
-            base.save(buffer, "png", optimize=True)
-
-        buffer.seek(0)
-        return buffer
+            return encode(base, fmt)
 
     @staticmethod
     @executor
-    def welcome(top_text: str, bottom_text: str, member_avatar: BytesIO):
-        font = ImageFont.truetype(f"{FONT_PATH}/arial_bold.ttf", size=20)
+    def welcome(
+        top_text: str, bottom_text: str, member_avatar: BytesIO, *, fmt: str = "auto"
+    ):
+        font = layouts.font("arial_bold.ttf", 20)
         join_w, member_w = font.getsize(bottom_text)[0], font.getsize(top_text)[0]
 
         with Image.new("RGB", (600, 400)) as card:
-            card.paste(Image.open(member_avatar).resize((263, 263)), (170, 32))
+            avatar = open_image(member_avatar, (263, 263)).resize((263, 263))
+            card.paste(avatar, (170, 32))
             draw = ImageDraw.Draw(card)
             draw.text(
                 ((600 - join_w) / 2, 309), bottom_text, (255, 255, 255), font=font
             )
             draw.text(((600 - member_w) / 2, 1), top_text, (169, 169, 169), font=font)
-            buffer = BytesIO()
-            card.save(buffer, "png", optimize=True)
-
-        buffer.seek(0)
-        return buffer
+            return encode(card, fmt)
 
     @staticmethod
     @executor
-    def pixelate(image: BytesIO):
-        with Image.open(image) as im:
-            small = im.resize((32, 32), resample=Image.BILINEAR)
-            result = small.resize(im.size, Image.NEAREST)
-            buffer = BytesIO()
-            result.save(buffer, "png")
+    def welcome_grid(
+        top_text: str, names: List[str], avatars: List[bytes], *, fmt: str = "auto"
+    ):
+        """A single welcome card of several members, up to 5 rows of 5 avatars."""
+        names, avatars = names[:25], avatars[:25]
+        rows = -(-len(avatars) // 5)
+        font = layouts.font("arial_bold.ttf", 20)
+        small = layouts.font("arial_bold.ttf", 12)
+
+        with Image.new("RGB", (600, 40 + rows * 120)) as card:
+            draw = ImageDraw.Draw(card)
+            top_w = font.getsize(top_text)[0]
+            draw.text(((600 - top_w) / 2, 8), top_text, (169, 169, 169), font=font)
 
-        buffer.seek(0)
-        return buffer
+            for i, (name, avatar) in enumerate(zip(names, avatars)):
+                x, y = 12 + i % 5 * 118, 40 + i // 5 * 120
+                avatar = open_image(BytesIO(avatar), (96, 96)).resize((96, 96))
+                card.paste(avatar, (x, y))
 
-    @staticmethod
-    @executor
-    def whyareyougae(author: BytesIO, member: BytesIO):
-        author = Image.open(author)
+                name = textwrap.shorten(name, 16, placeholder="…")
+                name_w = small.getsize(name)[0]
+                draw.text((x + (96 - name_w) / 2, y + 100), name, font=small)
 
-        with Image.open(f"{IMAGE_PATH}/wayg.jpg") as img:
-            img.paste(author, (507, 103))
-            img.paste(Image.open(member).resize((128, 128)), (77, 120))
-            buffer = BytesIO()
-            img.save(buffer, "png", optimize=True)
+            return encode(card, fmt)
 
-        buffer.seek(0)
-        return buffer
+    @staticmethod
+    @animated("pixelate")
+    @cached
+    @executor
+    def pixelate(image: BytesIO, *, fmt: str = "png"):
+        return apply_filter("pixelate", image, fmt)
 
     @staticmethod
+    @cached
     @executor
-    def fiveguysonegirl(author: BytesIO, member: BytesIO):
-        author = Image.open(author)
+    def template(name: str, *inputs, fmt: Optional[str] = None):
+        """Render one of the templates, see `Template`.
 
-        with Image.open(f"{IMAGE_PATH}/5g1g.png") as img:
-            img.paste(Image.open(member).resize((128, 128)), (500, 275))
+        Images and texts are given in the order of the template inputs,
+        the output format defaults to the one of the template.
+        """
+        template = templates[name]
+        values = {}
 
-            for i in [(31, 120), (243, 53), (438, 85), (637, 90), (815, 20)]:
-                img.paste(author, i)
+        for key, value in zip(template.inputs, inputs):
+            if template.kinds[key] == "image":
+                value = open_image(value, template.decode_size(key))
 
-            buffer = BytesIO()
-            img.save(buffer, "png", optimize=True)
+            values[key] = value
 
-        buffer.seek(0)
-        return buffer
+        return encode(template.render(values), fmt or template.format)
 
     @staticmethod
-    @executor
-    def wanted(image: BytesIO):
-        image = Image.open(image).resize((189, 205))
-
-        with Image.open(f"{IMAGE_PATH}/wanted.png") as img:
-            img.paste(image, (73, 185))
-            buffer = BytesIO()
-            img.save(buffer, "png")
-
-        buffer.seek(0)
-        return buffer
+    def whyareyougae(author: bytes, member: bytes, *, fmt: Optional[str] = None):
+        return Manip.template("whyareyougae", author, member, fmt=fmt)
 
     @staticmethod
-    @executor  # 395, 206 - knocked out; 236, 50 - winner
-    def fight(winner: BytesIO, knocked_out: BytesIO):
-        winner = Image.open(winner).resize((40, 40))
-        knocked_out = Image.open(knocked_out).resize((60, 60))
-
-        with Image.open(f"{IMAGE_PATH}/fight.jpg") as img:
-            img.paste(winner, (236, 50))
-            img.paste(knocked_out.rotate(-90), (395, 206))
-            buffer = BytesIO()
-            img.save(buffer, "png")
-
-        buffer.seek(0)
-        return buffer
+    def fiveguysonegirl(author: bytes, member: bytes, *, fmt: Optional[str] = None):
+        return Manip.template("fiveguysonegirl", author, member, fmt=fmt)
 
     @staticmethod
+    @cached
     @executor
-    def clyde(txt: str):
-        font = ImageFont.truetype(f"{FONT_PATH}/whitneybook.otf", 18)
-
-        with Image.open(f"{IMAGE_PATH}/clyde.png") as img:
-            draw = ImageDraw.Draw(img)
-            draw.text((72, 33), txt, (255, 255, 255), font=font)
-            buffer = BytesIO()
-            img.save(buffer, "png")
-
-        buffer.seek(0)
-        return buffer
+    def wanted(image: BytesIO, *, fmt: str = "auto"):
+        with open_image(image, (205, 205)) as im:
+            return encode(filters.FILTERS["wanted"](im), fmt)
 
     @staticmethod
-    @executor
-    def drake(no: str, yes: str):
-        no_wrapped = textwrap.wrap(text=no, width=13)
-        yes_wrapped = textwrap.wrap(text=yes, width=13)
-        font = ImageFont.truetype(f"{FONT_PATH}/arial_bold.ttf", size=28)
+    def fight(winner: bytes, knocked_out: bytes, *, fmt: Optional[str] = None):
+        return Manip.template("fight", winner, knocked_out, fmt=fmt)
 
-        with Image.open(f"{IMAGE_PATH}/drake.jpg") as img:
-            draw = ImageDraw.Draw(img)
-            draw.text((270, 10), "\n".join(no_wrapped), (0, 0, 0), font=font)
-            draw.text((270, 267), "\n".join(yes_wrapped), (0, 0, 0), font=font)
-            buffer = BytesIO()
-            img.save(buffer, "png")
+    @staticmethod
+    def clyde(txt: str, *, fmt: Optional[str] = None):
+        return Manip.template("clyde", txt, fmt=fmt)
 
-        buffer.seek(0)
-        return buffer
+    @staticmethod
+    def drake(no: str, yes: str, *, fmt: Optional[str] = None):
+        return Manip.template("drake", no, yes, fmt=fmt)
 
     @staticmethod
+    @animated("jail")
+    @cached
     @executor
-    def jail(image: BytesIO):
-        layout = WI(filename=f"{IMAGE_PATH}/jailbars.png")
+    def jail(image: BytesIO, *, fmt: str = "auto"):
+        if filters.backend != "wand":
+            return apply_filter("jail", image, fmt)
 
-        with WI(file=image) as img:
-            w, h = img.size
-            layout.resize(w, h)
-            img.watermark(layout, 0.3)
-            buffer = BytesIO()
-            img.save(file=buffer)
+        with open_wand(image, (512, 512)) as img:
+            with layouts.overlay("jailbars.png", *img.size) as layout:
+                img.watermark(layout, 0.3)
 
-        buffer.seek(0)
-        return buffer
+            return encode(img, fmt)
 
     @staticmethod
+    @cached
     @executor
-    def press_f(image: BytesIO):
-        layout = WI(filename=f"{IMAGE_PATH}/f.png")
-
-        with WI(file=image) as img:
+    def press_f(image: BytesIO, *, fmt: str = "auto"):
+        with layouts.wand("f.png") as layout, open_wand(image, (87, 87)) as img:
             img.resize(52, 87)
             img.rotate(-5)
-            buffer = BytesIO()
             layout.watermark(img, left=310, top=71)
-            layout.save(file=buffer)
-
-        buffer.seek(0)
-        return buffer
+            return encode(layout, fmt)
 
     @staticmethod
+    @animated("rainbow")
+    @cached
     @executor
-    def rainbow(image: BytesIO):
-        layout = WI(filename=f"{IMAGE_PATH}/rainbow.png")
+    def rainbow(image: BytesIO, *, fmt: str = "auto"):
+        if filters.backend != "wand":
+            return apply_filter("rainbow", image, fmt)
 
-        with WI(file=image) as img:
-            w, h = img.size
-            layout.resize(w, h)
-            img.watermark(layout, 0.5)
-            buffer = BytesIO()
-            img.save(file=buffer)
+        with open_wand(image, (512, 512)) as img:
+            with layouts.overlay("rainbow.png", *img.size) as layout:
+                img.watermark(layout, 0.5)
 
-        buffer.seek(0)
-        return buffer
+            return encode(img, fmt)
 
     @staticmethod
+    @animated("communist")
+    @cached
     @executor
-    def communist(image: BytesIO):
-        layout = WI(filename=f"{IMAGE_PATH}/communist-flag.jpg")
+    def communist(image: BytesIO, *, fmt: str = "auto"):
+        if filters.backend != "wand":
+            return apply_filter("communist", image, fmt)
 
-        with WI(file=image) as img:
-            w, h = img.size
-            layout.resize(w, h)
-            img.watermark(layout, 0.7)
-            buffer = BytesIO()
-            img.save(file=buffer)
+        with open_wand(image, (512, 512)) as img:
+            with layouts.overlay("communist-flag.jpg", *img.size) as layout:
+                img.watermark(layout, 0.7)
 
-        buffer.seek(0)
-        return buffer
+            return encode(img, fmt)
 
     @staticmethod
+    @animated("swirl")
     @executor
-    def swirl(degree: int, image: BytesIO):
+    def swirl(degree: int, image: BytesIO, *, fmt: str = "auto"):
         if degree > 360:
             degree = 360
 
         elif degree < -360:
             degree = -360
 
-        with WI(file=image) as img:
+        with open_wand(image, (512, 512)) as img:
             img.swirl(degree=degree)
-            buffer = BytesIO()
-            img.save(file=buffer)
+            return encode(img, fmt)
+
+    @staticmethod
+    @animated("pipe")
+    @cached
+    @executor
+    def pipeline(chain: str, image: BytesIO, *, fmt: str = "auto"):
+        """Run a filter chain, e.g `pixelate | swirl 120 | jail`.
 
-        buffer.seek(0)
-        return buffer
+        The image is decoded and encoded once, every stage works on the
+        decoded image in the same worker task. See `filters.parse_chain`.
+        """
+        return apply_filter("pipe", image, fmt, chain=chain)
 
     # https://github.com/AlexFlipnote/alex_api_archive/blob/master/render/achievement.py
     # thanks a lot!
-    def achievement(title: str, ach: str, colour=(255, 255, 0, 255)):
-        front = Image.open(f"{IMAGE_PATH}/achievement/achievement.png")
-        txt = Image.new("RGBA", (len(ach) * 15, 64))
-        fnt = ImageFont.truetype(f"{FONT_PATH}/minecraft.ttf", 16)
-        d = ImageDraw.Draw(txt)
-
-        w, h = d.textsize(ach, font=fnt)
-        w = max(320, w)
-
-        mid = Image.new("RGBA", (w + 20, 64), (255, 255, 255, 0))
-
-        midd = Image.open(f"{IMAGE_PATH}/achievement/mid.png")
-        end = Image.open(f"{IMAGE_PATH}/achievement/end.png")
-
-        for i in range(0, w):
-            mid.paste(midd, (i, 0))
-        mid.paste(end, (w, 0))
-
-        txt = Image.new("RGBA", (w + 20, 64), (255, 255, 255, 0))
-
-        d = ImageDraw.Draw(txt)
-        d.text((0, 9), title, font=fnt, fill=colour)
-        d.text((0, 29), ach, font=fnt, fill=(255, 255, 255, 255))
-
-        mid = Image.alpha_composite(mid, txt)
-
-        im = Image.new("RGBA", (w + 80, 64))
-
-        im.paste(front, (0, 0))
-        im.paste(mid, (60, 0))
-
-        buffer = BytesIO()
-        im.save(buffer, "PNG")
-        buffer.seek(0)
-        return buffer
+    @staticmethod
+    @cached
+    @executor
+    def achievement(
+        title: str, ach: str, colour=(255, 255, 0, 255), *, fmt: str = "png"
+    ):
+        font = layouts.font("minecraft.ttf", 16)
+        w = max(320, round(font.getlength(ach)))
+
+        with Image.new("RGBA", (w + 80, 64)) as im:
+            im.paste(layouts.image("achievement/achievement.png", copy=False), (0, 0))
+            # The middle sprite is a single column, stretching it tiles the strip.
+            mid = layouts.image("achievement/mid.png", copy=False)
+            im.paste(mid.resize((w, 64), Image.NEAREST), (60, 0))
+            im.paste(layouts.image("achievement/end.png", copy=False), (w + 60, 0))
+
+            draw = ImageDraw.Draw(im)
+            draw.text((60, 9), title, font=font, fill=colour)
+            draw.text((60, 29), ach, font=font, fill=(255, 255, 255, 255))
+
+            return encode(im, fmt)
@@ -0,0 +1,284 @@
+import asyncio
+import functools
+import hashlib
+import importlib
+import inspect
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from boribay.settings import (
+    RENDER_BACKEND,
+    RENDER_CACHE_MAX_BYTES,
+    RENDER_MAX_TASKS_PER_CHILD,
+    RENDER_WORKERS,
+)
+
+from .encoding import encoder_stats
+
+__all__ = ("RenderEngine", "RenderCache", "render_engine", "render_cache")
+
+logger = logging.getLogger("bot.rendering")
+
+
+def _resolve(module: str, qualname: str) -> Callable:
+    """Find the undecorated renderer by its module and qualified name.
+
+    Renderers are wrapped into async functions, so the original sync
+    function cannot be pickled directly and gets looked up instead.
+    """
+    obj = importlib.import_module(module)
+
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+
+    return inspect.unwrap(obj)
+
+
+def _as_bytes(value: Any) -> Any:
+    """Turn the image arguments into bytes, the only kind pickled cheaply.
+
+    A `BytesIO` over bytes shares their memory, so `getvalue` is free,
+    unlike `getbuffer`. Memory views and bytearrays get copied once.
+    """
+    if isinstance(value, BytesIO):
+        return value.getvalue()
+
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+
+    return value
+
+
+def _call(func: Callable, args: tuple, kwargs: dict) -> Tuple[Any, Optional[tuple]]:
+    """Call a renderer with bytes arguments and get its output as bytes.
+
+    The encoding info attached by `encode` is returned along the output.
+    Outputs other than buffers, e.g of the animation stages, are returned
+    as they are.
+    """
+    args = [BytesIO(a) if isinstance(a, bytes) else a for a in args]
+    kwargs = {k: BytesIO(v) if isinstance(v, bytes) else v for k, v in kwargs.items()}
+    output = func(*args, **kwargs)
+
+    if not isinstance(output, BytesIO):
+        return output, None
+
+    return output.getvalue(), getattr(output, "encoding", None)
+
+
+def _render(
+    module: str, qualname: str, args: tuple, kwargs: dict
+) -> Tuple[Any, Optional[tuple]]:
+    """The entry point of every task sent to a worker process."""
+    return _call(_resolve(module, qualname), args, kwargs)
+
+
+def _initialize(modules: tuple) -> None:
+    """Import the renderer modules and run their `warm_up` hooks once.
+
+    This is done when a worker process starts, or in the bot process
+    itself when the renderers run there.
+    """
+    for module in modules:
+        if (warm_up := getattr(importlib.import_module(module), "warm_up", None)):
+            warm_up()
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+class RenderEngine:
+    """The engine that runs the blocking image renderers.
+
+    Available backends are:
+        • process - a pool of pre-forked worker processes, renderers then
+          do not compete with the event loop for the GIL.
+        • thread - a pool of threads, used as the fallback as well.
+        • inline - runs renderers right in the caller, for benchmarks.
+
+    Only bytes cross the worker boundary: image arguments are passed
+    as bytes and the output buffer is returned as bytes.
+    """
+
+    def __init__(
+        self,
+        backend: str = "process",
+        *,
+        workers: Optional[int] = None,
+        max_tasks_per_child: Optional[int] = None,
+        modules: tuple = ("boribay.core.utils.manipulation",),
+    ):
+        if backend not in ("process", "thread", "inline"):
+            raise ValueError(f"Unknown render backend: {backend}")
+
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.max_tasks_per_child = max_tasks_per_child
+        self.modules = modules
+        self._processes = None
+        self._threads = None
+
+    def start(self) -> None:
+        """Create the pools and pre-fork the worker processes."""
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(self.workers, "render")
+
+            if self.backend != "process":
+                _initialize(self.modules)
+
+        if self.backend != "process" or self._processes is not None:
+            return
+
+        self._processes = ProcessPoolExecutor(
+            self.workers,
+            initializer=_initialize,
+            initargs=(self.modules,),
+            max_tasks_per_child=self.max_tasks_per_child,
+        )
+        for _ in range(self.workers):
+            self._processes.submit(_warm_up)
+
+    def shutdown(self) -> None:
+        """Shutdown the pools without waiting for the pending tasks."""
+        for pool in (self._processes, self._threads):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        self._processes = self._threads = None
+
+    async def run(self, func: Callable, *args, **kwargs) -> bytes:
+        """Run a renderer on the configured backend.
+
+        Args:
+            func (Callable): The undecorated renderer function.
+
+        Returns:
+            bytes: The rendered image.
+        """
+        args = tuple(_as_bytes(a) for a in args)
+        kwargs = {k: _as_bytes(v) for k, v in kwargs.items()}
+
+        output, encoding = await self._dispatch(func, args, kwargs)
+
+        if encoding is not None:
+            encoder_stats.record(func.__qualname__, encoding, len(output))
+
+        return output
+
+    async def _dispatch(
+        self, func: Callable, args: tuple, kwargs: dict
+    ) -> Tuple[Any, Optional[tuple]]:
+        if self.backend == "inline":
+            return _call(func, args, kwargs)
+
+        self.start()
+        loop = asyncio.get_running_loop()
+
+        if self.backend == "process":
+            task = functools.partial(
+                _render, func.__module__, func.__qualname__, args, kwargs
+            )
+            try:
+                return await loop.run_in_executor(self._processes, task)
+            except BrokenProcessPool:
+                logger.exception("Render workers died, falling back to threads.")
+                self.backend = "thread"
+                self._processes = None
+                _initialize(self.modules)
+
+        task = functools.partial(_call, func, args, kwargs)
+        return await loop.run_in_executor(self._threads, task)
+
+
+class RenderCache:
+    """The cache of encoded renderer outputs.
+
+    Renderers like `wanted` are pure functions of their inputs, so the
+    output is keyed by the renderer name, a hash of the input images and
+    the rest of the arguments. The least recently used outputs get
+    evicted once the cache takes more than `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._outputs: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+    @property
+    def stats(self) -> dict:
+        """Size and hit/miss counters of the cache."""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._outputs),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    @staticmethod
+    def make_key(name: str, args: tuple, kwargs: dict) -> Hashable:
+        """Build the cache key of a renderer call.
+
+        Args:
+            name (str): The qualified name of the renderer.
+            args (tuple): Positional arguments of the call.
+            kwargs (dict): Keyword arguments of the call.
+
+        Returns:
+            Hashable: The key, image arguments are replaced by their hashes.
+        """
+
+        def normalize(value):
+            if isinstance(value, BytesIO):
+                # `getbuffer` would copy a buffer that shares its bytes.
+                value = value.getvalue()
+
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                return hashlib.blake2b(value, digest_size=16).digest()
+
+            return value
+
+        return (
+            name,
+            tuple(normalize(a) for a in args),
+            tuple(sorted((k, normalize(v)) for k, v in kwargs.items())),
+        )
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """Get a cached output, None on a miss."""
+        if (output := self._outputs.get(key)) is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._outputs.move_to_end(key)
+        return output
+
+    def put(self, key: Hashable, output: bytes) -> None:
+        """Remember an output, evicting the least recently used ones."""
+        if len(output) > self.max_bytes or key in self._outputs:
+            return
+
+        self._outputs[key] = output
+        self.size += len(output)
+
+        while self.size > self.max_bytes:
+            _, evicted = self._outputs.popitem(last=False)
+            self.size -= len(evicted)
+
+
+render_engine = RenderEngine(
+    RENDER_BACKEND,
+    workers=RENDER_WORKERS,
+    max_tasks_per_child=RENDER_MAX_TASKS_PER_CHILD,
+)
+render_cache = RenderCache(RENDER_CACHE_MAX_BYTES)
@@ -0,0 +1,182 @@
+import asyncio
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import Deque, Dict, Optional
+
+from boribay.settings import (
+    RENDER_CONCURRENCY,
+    RENDER_QUEUE_SIZE,
+    RENDER_USER_LIMIT,
+)
+
+from ..exceptions import RendererBusy
+from .rendering import render_engine
+
+__all__ = ("RenderScheduler", "render_scheduler")
+
+
+class RenderScheduler:
+    """The admission control of the image commands.
+
+    At most `concurrency` renders run at once, the rest wait in a queue
+    of `max_queue` places. Waiting renders are granted guild by guild in
+    a weighted round-robin, so one busy guild cannot starve the others,
+    and a user may have only `max_per_user` renders running or waiting.
+    A guild gets as many grants per turn as its weight, see `set_weight`.
+
+    Renders over the limits are rejected right away with `RendererBusy`.
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: Optional[int] = None,
+        max_queue: int = 64,
+        max_per_user: int = 2,
+    ):
+        self.concurrency = concurrency or 2 * render_engine.workers
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        # Renders a guild gets per round-robin turn, 1 if not set.
+        self.weights: Dict[int, int] = {}
+        self.granted = 0
+        self.rejected = 0
+        self._running = 0
+        self._queued = 0
+        self._queues: "OrderedDict[int, Deque[asyncio.Future]]" = OrderedDict()
+        self._credits: Dict[int, int] = {}
+        self._users: Counter = Counter()
+        self._waits: Deque[float] = deque(maxlen=1000)
+
+    @property
+    def stats(self) -> dict:
+        """Queue depth, wait time and admission counters."""
+        waits = sorted(self._waits) or [0.0]
+
+        def percentile(q: float) -> float:
+            return round(waits[round(q * (len(waits) - 1))] * 1000, 2)
+
+        return {
+            "running": self._running,
+            "queued": self._queued,
+            "queued_guilds": len(self._queues),
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "wait_p50_ms": percentile(0.5),
+            "wait_p95_ms": percentile(0.95),
+        }
+
+    def set_weight(self, guild_id: int, weight: Optional[int]) -> None:
+        """Set the renders a guild gets per round-robin turn.
+
+        Args:
+            guild_id (int): The ID of the guild.
+            weight (Optional[int]): The weight, None or 1 for the default.
+        """
+        if weight is None or weight <= 1:
+            self.weights.pop(guild_id, None)
+        else:
+            self.weights[guild_id] = weight
+
+    def on_guild_change(self, op: str, row: dict, flush: Optional[str] = None) -> None:
+        """The change feed hook to follow the `render_weight` of the guilds."""
+        weight = None if op == "DELETE" else row.get("render_weight")
+        self.set_weight(row["guild_id"], weight)
+
+    @asynccontextmanager
+    async def slot(self, guild_id: Optional[int], user_id: int):
+        """Wait for a render slot, in the queue of the guild.
+
+        Args:
+            guild_id (Optional[int]): The guild of the command, None in DMs.
+            user_id (int): The author of the command.
+
+        Raises:
+            RendererBusy: If the user or the queue is over the limit.
+        """
+        if self._users[user_id] >= self.max_per_user:
+            self.rejected += 1
+            raise RendererBusy("You already have images rendering, wait a bit.")
+
+        if self._running >= self.concurrency and self._queued >= self.max_queue:
+            self.rejected += 1
+            raise RendererBusy("The image renderer is busy, try again in a bit.")
+
+        self._users[user_id] += 1
+        start = perf_counter()
+
+        try:
+            await self._acquire(guild_id or 0)
+            self.granted += 1
+            self._waits.append(perf_counter() - start)
+
+            try:
+                yield
+            finally:
+                self._release()
+        finally:
+            self._users[user_id] -= 1
+
+            if not self._users[user_id]:
+                del self._users[user_id]
+
+    async def _acquire(self, guild_id: int) -> None:
+        if self._running < self.concurrency and not self._queued:
+            self._running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(guild_id, deque()).append(future)
+        self._queued += 1
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # Still in the queue, leaving it.
+                self._remove(guild_id, future)
+            else:
+                # The slot was granted right before the cancellation.
+                self._release()
+            raise
+
+    def _remove(self, guild_id: int, future: asyncio.Future) -> None:
+        queue = self._queues[guild_id]
+        queue.remove(future)
+        self._queued -= 1
+
+        if not queue:
+            del self._queues[guild_id]
+            self._credits.pop(guild_id, None)
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._grant()
+
+    def _grant(self) -> None:
+        while self._running < self.concurrency and self._queues:
+            guild_id, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self._queued -= 1
+            credits = self._credits.get(guild_id, self.weights.get(guild_id, 1)) - 1
+
+            if not queue:
+                del self._queues[guild_id]
+                self._credits.pop(guild_id, None)
+            elif credits <= 0:
+                # The turn of this guild is over, the next one goes.
+                self._queues.move_to_end(guild_id)
+                self._credits.pop(guild_id, None)
+            else:
+                self._credits[guild_id] = credits
+
+            self._running += 1
+            future.set_result(None)
+
+
+render_scheduler = RenderScheduler(
+    concurrency=RENDER_CONCURRENCY,
+    max_queue=RENDER_QUEUE_SIZE,
+    max_per_user=RENDER_USER_LIMIT,
+)
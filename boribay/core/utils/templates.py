@@ -0,0 +1,297 @@
+import json
+import os
+import textwrap
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from discord.ext import commands
+from PIL import Image, ImageColor, ImageDraw
+
+from .layouts import IMAGE_PATH, layouts
+
+__all__ = ("Template", "TemplateRegistry", "templates")
+
+TEMPLATE_PATH = os.path.join(IMAGE_PATH, "templates")
+
+# The avatar sizes Discord serves, a slot requests the smallest that fits it.
+AVATAR_SIZES = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+
+class Slot(NamedTuple):
+    """A place of an input image on the layout."""
+
+    input: str
+    positions: Tuple[Tuple[int, int], ...]
+    size: Tuple[int, int]
+    # Degrees counter clockwise, as `Image.rotate` takes them.
+    rotation: float = 0
+    # Whether to resize the image to the exact size, or only to fit into it.
+    stretch: bool = True
+    request: int = 512
+
+
+class TextBox(NamedTuple):
+    """A place of an input text on the layout."""
+
+    input: str
+    position: Tuple[int, int]
+    font: str
+    size: int
+    color: Tuple[int, ...]
+    wrap: Optional[int] = None
+    max_length: Optional[int] = None
+
+
+class Template:
+    """A meme template, i.e a layout with image slots and text boxes.
+
+    Templates are described by JSON files in the templates folder of the
+    layouts, e.g `fight.json`:
+
+        {
+          "layout": "fight.jpg",
+          "format": "auto",
+          "inputs": ["winner", "knocked_out"],
+          "slots": [
+            {"input": "winner", "position": [236, 50], "size": [40, 40]},
+            {"input": "knocked_out", "position": [395, 206], "size": [60, 60],
+             "rotation": -90}
+          ]
+        }
+
+    `inputs` are the arguments of the template in order. A slot may have
+    several `positions` instead of one, `stretch` set to false to keep
+    the aspect ratio and the avatar size to `request`, the smallest one
+    fitting the slot by default. Text boxes take the `input`, `position`,
+    `font`, `size` and `color` keys, with the optional `wrap` width and
+    `max_length` of the text, which commands enforce by `check_texts`.
+
+    Every slot and text box gets compiled into a drawing step once, so
+    rendering is only a loop over the steps.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        layout: str,
+        inputs: List[str],
+        *,
+        slots: Sequence[Slot] = (),
+        texts: Sequence[TextBox] = (),
+        fmt: str = "auto",
+    ):
+        self.name = name
+        self.layout = layout
+        self.inputs = inputs
+        self.slots = slots
+        self.texts = texts
+        self.format = fmt
+        self.kinds = {s.input: "image" for s in slots}
+        self.kinds.update((t.input, "text") for t in texts)
+
+        if unknown := set(self.kinds) ^ set(inputs):
+            raise ValueError(
+                f"Template {name} has unused or undeclared inputs: "
+                + ", ".join(sorted(unknown))
+            )
+
+        self._steps = [self._compile_slot(s) for s in slots]
+        self._steps += [self._compile_text(t) for t in texts]
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict) -> "Template":
+        """Build a template from its JSON description.
+
+        Args:
+            name (str): The name of the template.
+            data (dict): The decoded JSON file.
+
+        Raises:
+            ValueError: If the description is invalid.
+
+        Returns:
+            Template: The compiled template.
+        """
+        slots, texts = [], []
+
+        try:
+            for slot in data.get("slots", ()):
+                size = tuple(slot["size"])
+                positions = slot.get("positions") or [slot["position"]]
+                slots.append(
+                    Slot(
+                        slot["input"],
+                        tuple(tuple(p) for p in positions),
+                        size,
+                        slot.get("rotation", 0),
+                        slot.get("stretch", True),
+                        slot.get("request") or _fitting_size(max(size)),
+                    )
+                )
+
+            for text in data.get("texts", ()):
+                texts.append(
+                    TextBox(
+                        text["input"],
+                        tuple(text["position"]),
+                        text["font"],
+                        text["size"],
+                        ImageColor.getrgb(text.get("color", "#ffffff")),
+                        text.get("wrap"),
+                        text.get("max_length"),
+                    )
+                )
+
+            return cls(
+                name,
+                data["layout"],
+                data["inputs"],
+                slots=slots,
+                texts=texts,
+                fmt=data.get("format", "auto"),
+            )
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Template {name} is invalid: {e!r}")
+
+    def check_texts(self, inputs: Sequence[Optional[str]]) -> None:
+        """Validate the texts of the inputs before anything gets downloaded.
+
+        Args:
+            inputs (Sequence[Optional[str]]): The inputs in the template order,
+                the images are not checked.
+
+        Raises:
+            commands.BadArgument: If a text is missing or longer than the
+            `max_length` of its box.
+        """
+        for box in self.texts:
+            index = self.inputs.index(box.input)
+            text = inputs[index] if index < len(inputs) else None
+
+            if text is None:
+                raise commands.BadArgument(f"`{self.name}` needs the {box.input}.")
+
+            if box.max_length and len(text) > box.max_length:
+                raise commands.BadArgument(
+                    f"`{self.name}` takes up to {box.max_length} characters "
+                    f"for the {box.input}."
+                )
+
+    def request_size(self, name: str) -> int:
+        """The avatar size to request for an image input.
+
+        Args:
+            name (str): The name of the input.
+
+        Returns:
+            int: The largest size any slot of the input requests.
+        """
+        return max(s.request for s in self.slots if s.input == name)
+
+    def decode_size(self, name: str) -> Tuple[int, int]:
+        """The largest size an image input is needed at."""
+        sizes = [s.size for s in self.slots if s.input == name]
+        return max(w for w, _ in sizes), max(h for _, h in sizes)
+
+    def render(self, values: Dict[str, Union[Image.Image, str]]) -> Image.Image:
+        """Draw the decoded images and the texts on a copy of the layout.
+
+        Args:
+            values (Dict[str, Union[Image.Image, str]]): The inputs by names.
+
+        Returns:
+            Image.Image: The rendered template.
+        """
+        canvas = layouts.image(self.layout)
+        draw = ImageDraw.Draw(canvas)
+
+        for step in self._steps:
+            step(canvas, draw, values)
+
+        return canvas
+
+    @staticmethod
+    def _compile_slot(slot: Slot) -> Callable:
+        def step(canvas: Image.Image, draw: ImageDraw.ImageDraw, values: dict):
+            image = values[slot.input]
+
+            if slot.stretch:
+                image = image.resize(slot.size)
+            elif image.width > slot.size[0] or image.height > slot.size[1]:
+                image = image.copy()
+                image.thumbnail(slot.size)
+
+            if slot.rotation:
+                image = image.rotate(slot.rotation, expand=True)
+
+            for position in slot.positions:
+                canvas.paste(image, position)
+
+        return step
+
+    @staticmethod
+    def _compile_text(box: TextBox) -> Callable:
+        def step(canvas: Image.Image, draw: ImageDraw.ImageDraw, values: dict):
+            text = values[box.input]
+
+            if box.wrap:
+                text = "\n".join(textwrap.wrap(text, width=box.wrap))
+
+            # Looked up here, the bot process never needs the fonts.
+            font = layouts.font(box.font, box.size)
+            draw.text(box.position, text, box.color, font=font)
+
+        return step
+
+
+def _fitting_size(size: int) -> int:
+    return next((s for s in AVATAR_SIZES if s >= size), AVATAR_SIZES[-1])
+
+
+class TemplateRegistry:
+    """The templates of the templates folder, loaded on the first use."""
+
+    def __init__(self, path: str = TEMPLATE_PATH):
+        self.path = path
+        self._templates: Optional[Dict[str, Template]] = None
+
+    def __getitem__(self, name: str) -> Template:
+        return self._load()[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def get(self, name: str) -> Optional[Template]:
+        """Get a template by its name, None if there is no such one."""
+        return self._load().get(name)
+
+    def warm_up(self) -> None:
+        """Load and compile every template in advance."""
+        self._load()
+
+    def _load(self) -> Dict[str, Template]:
+        if self._templates is None:
+            templates = {}
+
+            for file in sorted(os.listdir(self.path)):
+                name, extension = os.path.splitext(file)
+
+                if extension == ".json":
+                    with open(os.path.join(self.path, file)) as f:
+                        templates[name] = Template.from_dict(name, json.load(f))
+
+            self._templates = templates
+
+        return self._templates
+
+
+templates = TemplateRegistry()
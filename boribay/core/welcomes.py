@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Tuple
+
+import discord
+
+from boribay.core import utils
+
+__all__ = ("AutoroleWorker", "Greeter")
+
+logger = logging.getLogger("bot.welcomes")
+
+# The most members a grid welcome card has.
+GRID_SIZE = 25
+
+
+class Greeter:
+    """Sends the welcome cards of the joining members.
+
+    Cards are rendered and sent by `workers` tasks from a queue of
+    `max_queue` places, so a wave of joins never runs more renders at
+    once. Once a guild gets more than `threshold` joins in `window`
+    seconds, its next joins are collected for `window` seconds and get
+    welcomed by a single grid card instead.
+
+    Joins that do not fit into the queue are not welcomed, and counted.
+    """
+
+    def __init__(
+        self,
+        bot,
+        *,
+        threshold: int = 3,
+        window: float = 10.0,
+        max_queue: int = 32,
+        workers: int = 2,
+    ):
+        self.bot = bot
+        self.threshold = threshold
+        self.window = window
+        self.workers = workers
+        self.cards = 0
+        self.grids = 0
+        self.dropped = 0
+        # Join times of the guilds, only the last ones matter.
+        self._joins: Dict[int, Deque[float]] = {}
+        self._batches: Dict[int, List[Tuple[discord.Member, int]]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def stats(self) -> dict:
+        """Queue depth and welcome counters."""
+        return {
+            "queued": self._queue.qsize(),
+            "collecting_guilds": len(self._batches),
+            "cards": self.cards,
+            "grids": self.grids,
+            "dropped": self.dropped,
+        }
+
+    def start(self) -> None:
+        """Start the welcoming workers."""
+        self._tasks = [
+            asyncio.create_task(self._work()) for _ in range(self.workers)
+        ]
+
+    async def close(self) -> None:
+        """Stop the workers, the collected and queued joins are dropped."""
+        for timer in self._timers.values():
+            timer.cancel()
+
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def join(self, member: discord.Member) -> None:
+        """Welcome a member that just joined, right away or with a grid card.
+
+        Args:
+            member (discord.Member): The joined member.
+        """
+        guild_id = member.guild.id
+        entry = (member, member.guild.member_count)
+        now = time.monotonic()
+
+        joins = self._joins.setdefault(guild_id, deque(maxlen=self.threshold + 1))
+        joins.append(now)
+
+        if guild_id not in self._batches and (
+            len(joins) <= self.threshold or joins[0] < now - self.window
+        ):
+            return self._submit([entry])
+
+        batch = self._batches.setdefault(guild_id, [])
+        batch.append(entry)
+
+        if len(batch) >= GRID_SIZE:
+            self._flush(guild_id)
+        elif guild_id not in self._timers:
+            self._timers[guild_id] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, guild_id
+            )
+
+    def _flush(self, guild_id: int) -> None:
+        if (timer := self._timers.pop(guild_id, None)) is not None:
+            timer.cancel()
+
+        self._submit(self._batches.pop(guild_id))
+
+    def _submit(self, entries: List[Tuple[discord.Member, int]]) -> None:
+        try:
+            self._queue.put_nowait(entries)
+        except asyncio.QueueFull:
+            self.dropped += len(entries)
+            logger.warning(
+                f"Welcome queue is full, dropped {len(entries)} joins "
+                f"of {entries[0][0].guild}."
+            )
+
+    async def _work(self) -> None:
+        while True:
+            entries = await self._queue.get()
+
+            try:
+                await self._welcome(entries)
+            except Exception:
+                logger.exception(f"Could not welcome joins of {entries[0][0].guild}.")
+            finally:
+                self._queue.task_done()
+
+    async def _welcome(self, entries: List[Tuple[discord.Member, int]]) -> None:
+        guild = entries[0][0].guild
+
+        # The setting might have been changed while the joins were queued.
+        channel_id = self.bot.guild_cache[guild.id].get("welcome_channel")
+
+        if not channel_id or not (channel := guild.get_channel(channel_id)):
+            return
+
+        avatars = await asyncio.gather(
+            *(utils.assets.read_asset(m.display_avatar) for m, _ in entries)
+        )
+
+        if len(entries) == 1:
+            (member, count), avatar = entries[0], avatars[0]
+            image = await utils.Manip.welcome(
+                top_text=f"Member #{count}",
+                bottom_text=f"{member} just spawned in the server.",
+                member_avatar=avatar,
+            )
+            self.cards += 1
+            return await channel.send(file=utils.image_file(image, str(member)))
+
+        # Never more than GRID_SIZE entries, see `join`.
+        first, last = entries[0][1], entries[-1][1]
+        image = await utils.Manip.welcome_grid(
+            f"Members #{first}-#{last} just spawned in the server.",
+            [str(m) for m, _ in entries],
+            list(avatars),
+        )
+        self.grids += 1
+        await channel.send(file=utils.image_file(image, "welcome"))
+
+
+class AutoroleWorker:
+    """Gives the autoroles of the guilds to the joining members.
+
+    Members are queued by guild and handled by a single task, one guild
+    batch after another, so the role requests of a raid never go out at
+    once. Discord.py waits out the rate limits it is told about, a 429
+    that gets through pauses the worker for the advised time and the
+    rest of the batch is retried.
+    """
+
+    def __init__(self, bot, *, max_retries: int = 3):
+        self.bot = bot
+        self.max_retries = max_retries
+        self.given = 0
+        self.failed = 0
+        self._pending: "OrderedDict[int, Dict[int, discord.Member]]" = OrderedDict()
+        self._retries: Dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def stats(self) -> dict:
+        """Queue depth and role counters."""
+        return {
+            "pending": sum(len(batch) for batch in self._pending.values()),
+            "pending_guilds": len(self._pending),
+            "given": self.given,
+            "failed": self.failed,
+        }
+
+    def start(self) -> None:
+        """Start the worker task."""
+        self._task = asyncio.create_task(self._work())
+
+    async def close(self) -> None:
+        """Stop the worker, the pending members are dropped."""
+        if self._task is not None:
+            self._task.cancel()
+
+    def queue(self, member: discord.Member) -> None:
+        """Queue a member to get the autorole of their guild.
+
+        Args:
+            member (discord.Member): The joined member.
+        """
+        self._pending.setdefault(member.guild.id, {})[member.id] = member
+        self._wakeup.set()
+
+    async def _work(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._pending:
+                guild_id, batch = self._pending.popitem(last=False)
+
+                try:
+                    await self._give(guild_id, batch)
+                except Exception:
+                    logger.exception(f"Could not give the autorole in {guild_id}.")
+
+    async def _give(self, guild_id: int, batch: Dict[int, discord.Member]) -> None:
+        guild = self.bot.get_guild(guild_id)
+        role_id = self.bot.guild_cache[guild_id].get("autorole")
+
+        if guild is None or not role_id or not (role := guild.get_role(role_id)):
+            return
+
+        members = list(batch.values())
+
+        for i, member in enumerate(members):
+            if role in member.roles:
+                continue
+
+            try:
+                await member.add_roles(role, reason="Autorole")
+                self.given += 1
+
+            except discord.NotFound:
+                # The member has already left.
+                continue
+
+            except discord.Forbidden:
+                self.failed += len(members) - i
+                logger.warning(f"Missing permissions to give the autorole in {guild}.")
+                return
+
+            except discord.HTTPException as e:
+                retries = self._retries.get(guild_id, 0)
+
+                if (e.status != 429 and e.status < 500) or retries >= self.max_retries:
+                    self._retries.pop(guild_id, None)
+                    self.failed += len(members) - i
+                    raise
+
+                # Putting the rest back before the members queued meanwhile.
+                self._retries[guild_id] = retries + 1
+                rest = {m.id: m for m in members[i:]}
+                rest.update(self._pending.pop(guild_id, {}))
+                self._pending[guild_id] = rest
+                self._pending.move_to_end(guild_id, last=False)
+
+                retry_after = e.response.headers.get("Retry-After", 1)
+                return await asyncio.sleep(float(retry_after))
+
+        self._retries.pop(guild_id, None)
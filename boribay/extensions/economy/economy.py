@@ -7,7 +7,6 @@ import discord
 from discord.ext import commands
 
 from boribay.core import exceptions, utils
-from boribay.core.database import Cache
 
 from .games import Trivia, Work
 from .utils import CasinoConverter
@@ -22,7 +21,6 @@ class Economics(utils.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.economy_cache = Cache("SELECT * FROM economy", "user_id", self.bot.pool)
 
     async def cog_check(self, ctx: utils.Context):
         return await commands.guild_only().predicate(ctx)
@@ -30,13 +28,13 @@ class Economics(utils.Cog):
     @utils.command()
     async def register(self, ctx: utils.Context) -> None:
         """Register into Boribay economics system."""
-        if self.economy_cache[ctx.author.id]:
+        # The `users` table it inserts into, nothing writes to `economy`.
+        if await ctx.user_cache.fetch(ctx.author.id):
             return await ctx.send("You are already registered in the economics system.")
 
-        await self.bot.pool.execute(
-            "INSERT INTO users(user_id) VALUES($1)", ctx.author.id
+        await ctx.db.push(
+            "INSERT INTO users(user_id) VALUES($1) RETURNING *;", ctx.author.id
         )
-        await self.economy_cache.refresh()
         await ctx.send(
             "Welcome to the economics system! (test has successfully been passed.)"
         )
@@ -84,15 +82,17 @@ class Economics(utils.Cog):
                 "I cannot get why do you need more than 10 people."
             )
 
-        data = await ctx.bot.pool.fetch(
-            "SELECT * FROM users ORDER by wallet + bank DESC"
-        )
+        leaderboard = ctx.db.leaderboard
         users = [
-            f'**{ctx.bot.get_user(row["user_id"]) or row["user_id"]}** - {row["wallet"] + row["bank"]} {BATYR}'
-            for row in data[:limit]
+            f"**{ctx.bot.get_user(user_id) or user_id}** - {worth} {BATYR}"
+            for user_id, worth in await leaderboard.top(limit)
         ]
 
         embed = ctx.embed(title="The Global Leaderboard", description="\n".join(users))
+
+        if (rank := await leaderboard.rank(ctx.author.id)) is not None:
+            embed.set_footer(text=f"Your place: #{rank}")
+
         await ctx.send(embed=embed)
 
     @utils.group()
@@ -126,7 +126,7 @@ class Economics(utils.Cog):
             )
 
         member = member or ctx.author
-        query = "UPDATE users SET bank = bank + $1 WHERE user_id = $2;"
+        query = "UPDATE users SET bank = bank + $1 WHERE user_id = $2 RETURNING *;"
         await ctx.db.push(query, amount, member.id)
         await ctx.send(f"✅ Successfully added **{amount} {BATYR}** to **{member}**.")
 
@@ -155,7 +155,7 @@ class Economics(utils.Cog):
                 "Balance adding limit has reached. " "Specify between 100 and 100 000."
             )
 
-        query = "UPDATE users SET bank = bank - $1 WHERE user_id = $2;"
+        query = "UPDATE users SET bank = bank - $1 WHERE user_id = $2 RETURNING *;"
         await ctx.db.push(query, amount, member.id)
         await ctx.send(
             f"✅ Successfully removed **{amount} {BATYR}** from **{member}**."
@@ -180,7 +180,7 @@ class Economics(utils.Cog):
         """
         member = member or ctx.author
 
-        if not (data := ctx.user_cache[member.id]):
+        if not (data := await ctx.user_cache.fetch(member.id)):
             raise exceptions.DefaultError(f"{member} has no profile card.")
 
         data = copy.copy(data)
@@ -212,7 +212,7 @@ class Economics(utils.Cog):
         Raises:
             DefaultError: If you ask to {p}dep more money than you do have.
         """
-        data = ctx.user_cache[ctx.author.id]
+        data = await ctx.user_cache.fetch(ctx.author.id)
         wallet = data.get("wallet")
         amount = amount or wallet
 
@@ -221,9 +221,12 @@ class Economics(utils.Cog):
                 "Transfering amount cannot be higher than your wallet balance"
             )
 
-        query = (
-            "UPDATE users SET bank = bank + $1, wallet = wallet - $1 WHERE user_id = $2"
-        )
+        query = """
+        UPDATE users
+        SET bank = bank + $1, wallet = wallet - $1
+        WHERE user_id = $2
+        RETURNING *
+        """
 
         await ctx.db.push(query, amount, ctx.author.id)
         await ctx.send(f"Successfully transfered **{amount}** {BATYR} into your bank!")
@@ -243,7 +246,7 @@ class Economics(utils.Cog):
         Raises:
             DefaultError: If you ask to {p}wd more money than you do have.
         """
-        data = ctx.user_cache[ctx.author.id]
+        data = await ctx.user_cache.fetch(ctx.author.id)
         bank = data.get("bank")
         amount = amount or bank
 
@@ -256,6 +259,7 @@ class Economics(utils.Cog):
         UPDATE users
         SET bank = bank - $1, wallet = wallet + $1
         WHERE user_id = $2
+        RETURNING *
         """
 
         await ctx.db.push(query, amount, ctx.author.id)
@@ -277,7 +281,9 @@ class Economics(utils.Cog):
         Raises:
             DefaultError: If you have less than 100 batyrs on your balance.
         """
-        if (wallet := ctx.user_cache[ctx.author.id]["wallet"]) < 100:
+        data = await ctx.user_cache.fetch(ctx.author.id)
+
+        if (wallet := data["wallet"]) < 100:
             raise exceptions.DefaultError(
                 f"You have nothing to pay (less than 100 {BATYR})"
             )
@@ -320,12 +326,17 @@ class Economics(utils.Cog):
         """
         author = ctx.author.id
 
-        if (bank := ctx.user_cache[author]["bank"]) < 1000:
+        data = await ctx.user_cache.fetch(author)
+
+        if (bank := data["bank"]) < 1000:
             raise exceptions.DefaultError(
                 f"Setting bio requires at least 1000 {BATYR} (You have {bank})."
             )
 
-        query = "UPDATE users SET bio = $1, bank = bank - 1000 WHERE user_id = $2;"
+        query = (
+            "UPDATE users SET bio = $1, bank = bank - 1000 WHERE user_id = $2 "
+            "RETURNING *;"
+        )
         await ctx.db.push(query, information, author)
         await ctx.send("✅ Set your bio successfully.")
 
@@ -335,7 +346,9 @@ class Economics(utils.Cog):
 
         This is useful when you want just to remove your bio without paying.
         """
-        if not ctx.user_cache[ctx.author.id]["bio"]:
+        data = await ctx.user_cache.fetch(ctx.author.id)
+
+        if not data["bio"]:
             raise exceptions.DefaultError(
                 "You do not currently have bio set, "
                 "so there is no point on trying to disable it."
@@ -346,7 +359,7 @@ class Economics(utils.Cog):
         )
         if confirmation:
             await ctx.db.push(
-                "UPDATE users SET bio = null WHERE user_id = $1;", ctx.author.id
+                "UPDATE users SET bio = null WHERE user_id = $1 RETURNING *;", ctx.author.id
             )
             await ctx.send("✅ Disabled your bio successfully.")
 
@@ -372,7 +385,9 @@ class Economics(utils.Cog):
             DefaultError: When a user tries to be funny (rob themself).
             DefaultError: When a victim has not enough batyrs to get robbed.
         """
-        if (member_wallet := ctx.user_cache[member.id]["wallet"]) < 100:
+        data = await ctx.user_cache.fetch(member.id)
+
+        if (member_wallet := data["wallet"]) < 100:
             raise exceptions.DefaultError(
                 f"{member} had nothing to steal (less than 100 {BATYR})"
             )
@@ -381,8 +396,8 @@ class Economics(utils.Cog):
             population=["success", "caught"], weights=(0.5, 0.5), k=1
         )[0]
         if choice == "caught":
-            author_bank = ctx.user_cache[ctx.author.id]["bank"]
-            fine = author_bank * 0.1
+            author_bank = (await ctx.user_cache.fetch(ctx.author.id))["bank"]
+            fine = round(author_bank * 0.1)
             await ctx.db.double("bank", fine, ctx.author, member)
             return await ctx.reply(
                 f"You were caught by police and **{fine}** from your bank "
@@ -390,7 +405,7 @@ class Economics(utils.Cog):
             )
 
         amount = random.randint(100, member_wallet)
-        await ctx.db.double("bank", fine, member, ctx.author)
+        await ctx.db.double("wallet", amount, member, ctx.author)
         await ctx.send(f"✅ Stole **{amount}** {BATYR} from **{member}**")
 
     @utils.command(aliases=("slots",))
@@ -408,7 +423,6 @@ class Economics(utils.Cog):
         """
         a, b, c = random.choices("🍎🍊🍐🍋🍉🍇🍓🍒", k=3)
         text = f"{a} | {b} | {c}\n{ctx.author.display_name}, "
-        query = "UPDATE users SET wallet = wallet + $1 WHERE user_id = $2;"
 
         if a == b == c:
             result = bet * 20
@@ -421,11 +435,10 @@ class Economics(utils.Cog):
             await ctx.send(f"{text}2 match, you won! 🎉 {result} {BATYR}!")
 
         else:
-            query = "UPDATE users SET wallet = wallet - $1 WHERE user_id = $2;"
-            result = bet
+            result = -bet
             await ctx.send(f"{text}No matches, I wish you win next time. No batyrs.")
 
-        await ctx.db.push(query, result, ctx.author.id)
+        ctx.db.queue("wallet", ctx.author, result)
 
     @utils.command()
     async def work(self, ctx: utils.Context) -> None:
@@ -475,10 +488,8 @@ class Economics(utils.Cog):
         await asyncio.sleep(5.0)
 
         if choice == (answer := random.choice(choices)):
-            query = "UPDATE users SET wallet = wallet + 50 WHERE user_id = $1"
             embed.title = f"You guessed right! ({answer}) → +50 {BATYR}."
-
-            await ctx.db.push(query, ctx.author.id)
+            ctx.db.queue("wallet", ctx.author, 50)
 
         else:
             embed.title = f"Unfortunately, you guessed wrong ({answer})."
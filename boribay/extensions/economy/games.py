@@ -35,9 +35,7 @@ class Work:
             return await ctx.send("❌ Seems you did not provide the number.")
 
         if guessed == number:
-            query = "UPDATE users SET wallet = wallet + 100 WHERE user_id = $1;"
-            await ctx.bot.pool.execute(query, ctx.author.id)
-            await ctx.bot.user_cache.refresh()
+            ctx.bot.db.queue("wallet", ctx.author, 100)
             return await ctx.send(
                 f"✅ You are right! The number was: {number} → +100 batyrs."
             )
@@ -79,8 +77,8 @@ class Trivia:
         answer = await Trivia(ctx, entries, question["question"]).start()
 
         if answer == question["correct_answer"]:
-            await ctx.reply(f"**Correct! (+50)** The answer was: **{correct}**")
-            return await self.ctx.bot.db.add("wallet", ctx.author, 50)
+            ctx.bot.db.queue("wallet", ctx.author, 50)
+            return await ctx.reply(f"**Correct! (+50)** The answer was: **{correct}**")
 
         return await ctx.reply(f"**Wrong!** The answer was: **{correct}**.")
 
@@ -105,9 +105,9 @@ def get_amount(_all: float, minimum: int, maximum: int, argument):
 def CasinoConverter(minimum: int = 100, maximum: int = 100_000):
     class _Wrapper(commands.Converter, int):
         async def convert(self, ctx, argument):
-            _all = await ctx.bot.pool.fetchval(
-                "SELECT wallet FROM users WHERE user_id = $1", ctx.author.id
-            )
+            # The cache also counts the balance changes that are not written yet.
+            data = await ctx.bot.user_cache.fetch(ctx.author.id)
+            _all = data.get("wallet", 0)
             amount = get_amount(_all, minimum, maximum, argument)
             return amount
 
@@ -102,10 +102,11 @@ class Fun(utils.Cog):
                 "Timeout limit has been reached. Specify between 10 and 120."
             )
 
-        async with ctx.loading:
-            r = await ctx.bot.session.get("https://api.quotable.io/random")
-            quote = await r.json()
-            content = quote["content"]
+        r = await ctx.bot.session.get("https://api.quotable.io/random")
+        quote = await r.json()
+        content = quote["content"]
+
+        async with ctx.rendering:
             buffer = await utils.Manip.typeracer("\n".join(textwrap.wrap(content, 30)))
 
         embed = ctx.embed(
@@ -113,7 +114,7 @@ class Fun(utils.Cog):
         ).set_image(url="attachment://typeracer.png")
         embed.set_footer(text=f'© {quote["author"]}')
 
-        race = await ctx.send(file=discord.File(buffer, "typeracer.png"), embed=embed)
+        race = await ctx.send(file=utils.image_file(buffer, "typeracer"), embed=embed)
         await race.add_reaction("🗑")
         start = time()
 
@@ -1,11 +1,11 @@
 import random
-from io import BytesIO
 from typing import Optional
 
 import discord
 from discord.ext import commands
 
 from boribay.core import utils
+from boribay.core.utils.downloads import assets
 from boribay.core.utils.manipulation import Manip, make_image
 
 
@@ -42,11 +42,12 @@ class Images(utils.Cog):
         Args:
             image (Optional[str]): An image you want to pixelate.
         """
-        async with ctx.loading:
-            image = await make_image(ctx, image)
-            buffer = await Manip.pixelate(BytesIO(image))
+        image = await make_image(ctx, image, animated=True)
 
-        file = discord.File(buffer, "pixelated.png")
+        async with ctx.rendering:
+            buffer = await Manip.pixelate(image)
+
+        file = utils.image_file(buffer, "pixelated")
         await ctx.send(file=file)
 
     @utils.command()
@@ -54,8 +55,10 @@ class Images(utils.Cog):
         if len(title) > 90:
             raise commands.BadArgument("The text was too long to render.")
 
-        buffer = await Manip.achievement(title, "ema")
-        file = discord.File(buffer, "achievement.png")
+        async with ctx.render_slot():
+            buffer = await Manip.achievement(title, "ema")
+
+        file = utils.image_file(buffer, "achievement")
         await ctx.send(file=file)
 
     @utils.command()
@@ -68,11 +71,13 @@ class Images(utils.Cog):
         Args:
             image (Optional[str]): A member you want to make wanted.
         """
-        async with ctx.loading:
-            image = await make_image(ctx, image)
-            buffer = await Manip.wanted(BytesIO(image))
+        size = utils.templates["wanted"].request_size("image")
+        image = await make_image(ctx, image, size=size)
+
+        async with ctx.rendering:
+            buffer = await Manip.wanted(image)
 
-        file = discord.File(buffer, "wanted.png")
+        file = utils.image_file(buffer, "wanted")
         await ctx.send(file=file)
 
     @utils.command()
@@ -85,11 +90,12 @@ class Images(utils.Cog):
         Args:
             image (Optional[str]): A member you want to see in jail.
         """
-        async with ctx.loading:
-            image = await make_image(ctx, image)
-            buffer = await Manip.jail(BytesIO(image))
+        image = await make_image(ctx, image, animated=True)
 
-        file = discord.File(buffer, "jail.png")
+        async with ctx.rendering:
+            buffer = await Manip.jail(image)
+
+        file = utils.image_file(buffer, "jail")
         await ctx.send(file=file)
 
     @utils.command(name="f")
@@ -102,11 +108,12 @@ class Images(utils.Cog):
         Args:
             image (Optional[str]): A member you want to F.
         """
-        async with ctx.loading:
-            image = await make_image(ctx, image)
-            buffer = await Manip.press_f(BytesIO(image))
+        image = await make_image(ctx, image)
+
+        async with ctx.rendering:
+            buffer = await Manip.press_f(image)
 
-        file = discord.File(buffer, "f.png")
+        file = utils.image_file(buffer, "f")
         message = await ctx.send(file=file)
         await message.add_reaction("<:press_f:796264575065653248>")
 
@@ -120,12 +127,15 @@ class Images(utils.Cog):
         Args:
             member (Optional[str]): A member you would like to 5g1g.
         """
-        async with ctx.loading:
-            author = await ctx.author.avatar.replace(size=128).read()
-            member = await make_image(ctx, member)
-            buffer = await Manip.fiveguysonegirl(BytesIO(author), BytesIO(member))
+        template = utils.templates["fiveguysonegirl"]
+        avatar = utils.avatar_asset(ctx.author, template.request_size("author"))
+        author = await assets.read_asset(avatar)
+        member = await make_image(ctx, member, size=template.request_size("member"))
 
-        file = discord.File(buffer, "5g1g.png")
+        async with ctx.rendering:
+            buffer = await Manip.fiveguysonegirl(author, member)
+
+        file = utils.image_file(buffer, "5g1g")
         await ctx.send(file=file)
 
     @utils.command(aliases=("ko",))
@@ -138,12 +148,17 @@ class Images(utils.Cog):
         Args:
             member (str): A member you would like to knockout.
         """
-        async with ctx.loading:
-            winner = await ctx.author.avatar.replace(size=64).read()
-            knocked_out = await make_image(ctx, member)
-            buffer = await Manip.fight(BytesIO(winner), BytesIO(knocked_out))
+        template = utils.templates["fight"]
+        avatar = utils.avatar_asset(ctx.author, template.request_size("winner"))
+        winner = await assets.read_asset(avatar)
+        knocked_out = await make_image(
+            ctx, member, size=template.request_size("knocked_out")
+        )
+
+        async with ctx.rendering:
+            buffer = await Manip.fight(winner, knocked_out)
 
-        file = discord.File(buffer, "fight.png")
+        file = utils.image_file(buffer, "fight")
         await ctx.send(file=file)
 
     @utils.command()
@@ -161,11 +176,42 @@ class Images(utils.Cog):
         """
         degrees = degrees or random.randint(-360, 360)
 
-        async with ctx.loading:
-            image = await make_image(ctx, image)
-            buffer = await Manip.swirl(degrees, BytesIO(image))
+        image = await make_image(ctx, image, animated=True)
+
+        async with ctx.rendering:
+            buffer = await Manip.swirl(degrees, image)
+
+        file = utils.image_file(buffer, "swirl")
+        await ctx.send(file=file)
+
+    @utils.command(aliases=("chain",))
+    async def pipe(self, ctx, *, chain: str) -> None:
+        """Run several filters on an image at once.
+
+        Filters are separated by "|", their arguments go after the names.
+
+        Example:
+            **{p}pipe @Dosek pixelate | swirl 120 | jail** - does it all to Dosek.
+
+        Args:
+            chain (str): An optional image followed by the filter chain.
+
+        Raises:
+            commands.BadArgument: If the filter chain is invalid.
+        """
+        image, chain = utils.split_image(chain)
+
+        try:
+            utils.parse_chain(chain)
+        except ValueError as e:
+            raise commands.BadArgument(str(e))
+
+        image = await make_image(ctx, image, animated=True)
 
-        file = discord.File(buffer, "swirl.png")
+        async with ctx.rendering:
+            buffer = await Manip.pipeline(chain, image)
+
+        file = utils.image_file(buffer, "pipe")
         await ctx.send(file=file)
 
     @utils.command()
@@ -178,11 +224,12 @@ class Images(utils.Cog):
         Args:
             image (Optional[str]): An image to put under the communist flag.
         """
-        async with ctx.loading:
-            image = await make_image(ctx, image)
-            buffer = await Manip.communist(BytesIO(image))
+        image = await make_image(ctx, image, animated=True)
+
+        async with ctx.rendering:
+            buffer = await Manip.communist(image)
 
-        file = discord.File(buffer, "communist.png")
+        file = utils.image_file(buffer, "communist")
         await ctx.send(file=file)
 
     @utils.command(aliases=("gay", "gayize"))
@@ -195,11 +242,12 @@ class Images(utils.Cog):
         Args:
             image (Optional[str]): An image you want to "gayize".
         """
-        async with ctx.loading:
-            image = await make_image(ctx, image)
-            buffer = await Manip.rainbow(BytesIO(image))
+        image = await make_image(ctx, image, animated=True)
 
-        file = discord.File(buffer, "rainbow.png")
+        async with ctx.rendering:
+            buffer = await Manip.rainbow(image)
+
+        file = utils.image_file(buffer, "rainbow")
         await ctx.send(file=file)
 
     @utils.command(aliases=("wayg",))
@@ -212,13 +260,15 @@ class Images(utils.Cog):
         Args:
             member (Optional[str]): A member you would like to "wayg".
         """
-        author = await ctx.author.avatar.replace(size=128).read()
+        template = utils.templates["whyareyougae"]
+        avatar = utils.avatar_asset(ctx.author, template.request_size("author"))
+        author = await assets.read_asset(avatar)
+        member = await make_image(ctx, member, size=template.request_size("member"))
 
-        async with ctx.loading:
-            member = await make_image(ctx, member)
-            buffer = await Manip.whyareyougae(BytesIO(author), BytesIO(member))
+        async with ctx.rendering:
+            buffer = await Manip.whyareyougae(author, member)
 
-        file = discord.File(buffer, "wayg.png")
+        file = utils.image_file(buffer, "wayg")
         await ctx.send(file=file)
 
     @utils.command()
@@ -233,14 +283,14 @@ class Images(utils.Cog):
             yes (str): Text that Drake likes a lot.
 
         Raises:
-            commands.BadArgument: If the text limit reaches (90 characters for each).
+            commands.BadArgument: If a text is longer than the template allows.
         """
-        if len(yes) > 90 or len(no) > 90:
-            raise commands.BadArgument("The text was too long to render.")
+        utils.templates["drake"].check_texts((no, yes))
 
-        buffer = await Manip.drake(no, yes)
+        async with ctx.render_slot():
+            buffer = await Manip.drake(no, yes)
 
-        file = discord.File(buffer, "drake.png")
+        file = utils.image_file(buffer, "drake")
         await ctx.send(file=file)
 
     @utils.command()
@@ -254,12 +304,58 @@ class Images(utils.Cog):
             text (str): What should Clyde say.
 
         Raises:
-            commands.BadArgument: If the text limit reaches (75 characters).
+            commands.BadArgument: If the text is longer than the template allows.
         """
-        if len(text) > 75:
-            raise commands.BadArgument("The text was too long to render.")
+        utils.templates["clyde"].check_texts((text,))
+
+        async with ctx.render_slot():
+            buffer = await Manip.clyde(text)
 
-        buffer = await Manip.clyde(text)
+        file = utils.image_file(buffer, "clyde")
+        await ctx.send(file=file)
+
+    @utils.command(aliases=("template",))
+    async def meme(self, ctx: utils.Context, name: str, *arguments: str) -> None:
+        """Make a meme out of any of the templates.
+
+        Images and texts are given in the order the template takes them,
+        missing images default to your avatar. Texts with spaces should
+        be quoted.
+
+        Example:
+            **{p}meme fight @Dosek @Dositan** - Dosek knocks Dositan out.
 
-        file = discord.File(buffer, "clyde.png")
+        Args:
+            name (str): The name of the template.
+            arguments (str): The images and texts of the template.
+
+        Raises:
+            commands.BadArgument: If the template does not exist, or if a
+            text is missing or too long.
+        """
+        if (template := utils.templates.get(name.lower())) is None:
+            raise commands.BadArgument(
+                "Unknown template. Available ones are: "
+                + ", ".join(f"`{t}`" for t in utils.templates)
+            )
+
+        if len(arguments) > len(template.inputs):
+            raise commands.BadArgument(
+                f"`{template.name}` takes: " + ", ".join(template.inputs)
+            )
+
+        arguments += (None,) * (len(template.inputs) - len(arguments))
+        template.check_texts(arguments)
+
+        inputs = [
+            await make_image(ctx, arg, size=template.request_size(key))
+            if template.kinds[key] == "image"
+            else arg
+            for key, arg in zip(template.inputs, arguments)
+        ]
+
+        async with ctx.rendering:
+            buffer = await Manip.template(template.name, *inputs)
+
+        file = utils.image_file(buffer, template.name)
         await ctx.send(file=file)
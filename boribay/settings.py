@@ -7,6 +7,51 @@ DISCORD_TOKEN = os.environ.get('DISCORD_TOKEN')
 # Database
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Cache
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 10_000))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 3600))
+
+# Economy
+LEDGER_FLUSH_MS = int(os.environ.get('LEDGER_FLUSH_MS', 500))
+
+# Rendering (backends: process, thread, inline; 0 means the default)
+RENDER_BACKEND = os.environ.get('RENDER_BACKEND', 'process')
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 0)) or None
+RENDER_MAX_TASKS_PER_CHILD = int(os.environ.get('RENDER_MAX_TASKS_PER_CHILD', 500)) or None
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 32 * 1024 ** 2))
+RENDER_BYTE_BUDGET = int(os.environ.get('RENDER_BYTE_BUDGET', 8 * 1024 ** 2)) or None
+RENDER_MAX_PIXELS = int(os.environ.get('RENDER_MAX_PIXELS', 4096 * 4096))
+
+# Render admission (0 concurrency means twice the workers)
+RENDER_CONCURRENCY = int(os.environ.get('RENDER_CONCURRENCY', 0)) or None
+RENDER_QUEUE_SIZE = int(os.environ.get('RENDER_QUEUE_SIZE', 64))
+RENDER_USER_LIMIT = int(os.environ.get('RENDER_USER_LIMIT', 2))
+
+# Filters (backends: numpy, pillow, wand)
+FILTER_BACKEND = os.environ.get('FILTER_BACKEND', 'numpy')
+
+# Animated images (frames over the caps are dropped, the duration is in seconds)
+RENDER_FRAME_SIZE = int(os.environ.get('RENDER_FRAME_SIZE', 256))
+RENDER_MAX_FRAMES = int(os.environ.get('RENDER_MAX_FRAMES', 100))
+RENDER_MAX_DURATION = float(os.environ.get('RENDER_MAX_DURATION', 15))
+
+# Welcomes (more joins per window than the threshold get grid cards)
+WELCOME_BURST_THRESHOLD = int(os.environ.get('WELCOME_BURST_THRESHOLD', 3))
+WELCOME_BURST_WINDOW = float(os.environ.get('WELCOME_BURST_WINDOW', 10))
+WELCOME_QUEUE_SIZE = int(os.environ.get('WELCOME_QUEUE_SIZE', 32))
+
+# Downloaded images (the disk tier is disabled unless a path is given)
+ASSET_CACHE_MAX_BYTES = int(os.environ.get('ASSET_CACHE_MAX_BYTES', 64 * 1024 ** 2))
+ASSET_CACHE_PATH = os.environ.get('ASSET_CACHE_PATH')
+ASSET_CACHE_DISK_MAX_BYTES = int(os.environ.get('ASSET_CACHE_DISK_MAX_BYTES', 512 * 1024 ** 2))
+DOWNLOAD_MAX_BYTES = int(os.environ.get('DOWNLOAD_MAX_BYTES', 8 * 1024 ** 2))
+DOWNLOAD_TIMEOUT = float(os.environ.get('DOWNLOAD_TIMEOUT', 10))
+
+# Twemoji images (always kept on disk, the path must be writable)
+TWEMOJI_CACHE_MAX_BYTES = int(os.environ.get('TWEMOJI_CACHE_MAX_BYTES', 4 * 1024 ** 2))
+TWEMOJI_CACHE_PATH = os.environ.get('TWEMOJI_CACHE_PATH', './data/cache/twemoji')
+TWEMOJI_CACHE_DISK_MAX_BYTES = int(os.environ.get('TWEMOJI_CACHE_DISK_MAX_BYTES', 32 * 1024 ** 2))
+
 # APIs
 DAGPI_API_KEY = os.environ.get("DAGPI_API_KEY")
 WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY')
@@ -3,9 +3,13 @@ CREATE TABLE IF NOT EXISTS guild_config (
     prefix VARCHAR(10) NOT NULL DEFAULT '.',
     welcome_channel BIGINT,
     embed_color INTEGER DEFAULT 3553598,
-    autorole BIGINT
+    autorole BIGINT,
+    -- Renders the guild gets per turn of the render queue.
+    render_weight SMALLINT NOT NULL DEFAULT 1
 );
 
+ALTER TABLE guild_config ADD COLUMN IF NOT EXISTS render_weight SMALLINT NOT NULL DEFAULT 1;
+
 CREATE TABLE IF NOT EXISTS todos (
     id SERIAL PRIMARY KEY,
     user_id BIGINT not null,
@@ -17,9 +21,14 @@ CREATE TABLE IF NOT EXISTS todos (
 CREATE TABLE IF NOT EXISTS users (
     user_id BIGINT NOT NULL,
     blacklisted BOOLEAN DEFAULT false,
-    bio VARCHAR(190)
+    bio VARCHAR(190),
+    wallet INTEGER DEFAULT 0,
+    bank INTEGER DEFAULT 0
 );
 
+-- Serves the economy leaderboard until its in-memory ranking is loaded.
+CREATE INDEX IF NOT EXISTS users_net_worth_idx ON users ((wallet + bank) DESC);
+
 CREATE TABLE IF NOT EXISTS economy (
     user_id BIGINT NOT NULL,
     wallet INTEGER DEFAULT 0,
@@ -36,4 +45,40 @@ CREATE TABLE IF NOT EXISTS ideas (
 
 CREATE TABLE IF NOT EXISTS bot_stats (
     command_usage INTEGER DEFAULT 0
-)
\ No newline at end of file
+);
+
+-- Change feed: every bot process listens on this channel and patches
+-- its local caches, so the writes of one process are seen by the others.
+CREATE OR REPLACE FUNCTION notify_cache_change() RETURNS TRIGGER AS $$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+
+    PERFORM pg_notify(
+        'cache_changes',
+        json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'row', row_to_json(changed),
+            -- Set by the balance ledger flushes, see DatabaseManager.flush.
+            'flush', NULLIF(current_setting('boribay.flush', true), '')
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS guild_config_cache_changes ON guild_config;
+CREATE TRIGGER guild_config_cache_changes
+    AFTER INSERT OR UPDATE OR DELETE ON guild_config
+    FOR EACH ROW EXECUTE FUNCTION notify_cache_change();
+
+DROP TRIGGER IF EXISTS users_cache_changes ON users;
+CREATE TRIGGER users_cache_changes
+    AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_cache_change();
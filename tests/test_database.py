@@ -0,0 +1,129 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from boribay.core.database import Cache, ChangeFeed, DatabaseManager
+
+
+class FakeConnection:
+    """Commits by running `on_commit`, as the server would send NOTIFY."""
+
+    def __init__(self, on_commit):
+        self.on_commit = on_commit
+        self.settings = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def transaction(self):
+        return self
+
+    async def execute(self, query, *args):
+        if "set_config" in query:
+            self.settings["boribay.flush"] = args[0]
+            return
+
+        # The transaction callback, i.e. the commit of the flush.
+        self.on_commit(dict(zip(("users", "wallets", "banks"), args)), self.settings)
+
+
+class FakePool:
+    def __init__(self, on_commit):
+        self.on_commit = on_commit
+
+    def acquire(self):
+        return FakeConnection(self.on_commit)
+
+
+def make_bot(rows, on_commit):
+    bot = SimpleNamespace(pool=FakePool(on_commit))
+    bot.db = DatabaseManager(bot)
+    bot.user_cache = Cache("", "user_id", bot.pool, pending=bot.db.pending)
+
+    for row in rows.values():
+        bot.user_cache.patch(row)
+        bot.db.leaderboard.track(row)
+
+    bot.db.leaderboard.ready = True
+    feed = ChangeFeed("", {"users": bot.user_cache})
+    feed.hooks["users"].append(bot.db.on_user_change)
+    return bot, feed
+
+
+def notify(feed, row, flush=None):
+    payload = {"table": "users", "op": "UPDATE", "row": row, "flush": flush}
+    feed._on_notify(None, 0, feed.channel, json.dumps(payload))
+
+
+def test_notify_before_flush_returns_is_not_counted_twice():
+    rows = {1: {"user_id": 1, "wallet": 100, "bank": 0}}
+
+    def commit(args, settings):
+        for user, wallet, bank in zip(*args.values()):
+            rows[user]["wallet"] += wallet
+            rows[user]["bank"] += bank
+            notify(feed, rows[user], settings["boribay.flush"])
+
+    bot, feed = make_bot(rows, commit)
+    bot.db.queue("wallet", SimpleNamespace(id=1), 50)
+    assert bot.user_cache[1]["wallet"] == 150
+
+    asyncio.run(bot.db.flush())
+
+    assert bot.user_cache[1]["wallet"] == 150
+    assert bot.db.pending(1) == {}
+    assert asyncio.run(bot.db.leaderboard.top(1)) == [(1, 150)]
+
+
+def test_foreign_notify_during_flush_keeps_the_deltas():
+    rows = {1: {"user_id": 1, "wallet": 100, "bank": 0}}
+
+    def commit(args, settings):
+        # Another process changed the row, without the deltas being flushed.
+        rows[1]["bank"] += 10
+        notify(feed, rows[1], "another:1")
+        assert bot.user_cache[1] == {"wallet": 150, "bank": 10}
+
+    bot, feed = make_bot(rows, commit)
+    bot.db.queue("wallet", SimpleNamespace(id=1), 50)
+    asyncio.run(bot.db.flush())
+
+
+def test_changes_during_load_are_kept():
+    rows = {
+        1: {"user_id": 1, "wallet": 100, "bank": 0},
+        2: {"user_id": 2, "wallet": 50, "bank": 0},
+    }
+    bot, feed = make_bot(rows, None)
+    leaderboard = bot.db.leaderboard
+    fetched = asyncio.Event()
+    resume = asyncio.Event()
+
+    async def fetch(query):
+        # The rows as the table was read, before the changes below.
+        snapshot = [dict(row) for row in rows.values()]
+        fetched.set()
+        await resume.wait()
+        return snapshot
+
+    async def main():
+        bot.pool.fetch = fetch
+        load = asyncio.create_task(leaderboard.load())
+        await fetched.wait()
+
+        notify(feed, {"user_id": 1, "wallet": 10, "bank": 0})
+        notify(feed, {"user_id": 3, "wallet": 70, "bank": 0})
+        bot.db.queue("wallet", SimpleNamespace(id=3), 5)
+        leaderboard.remove(2)
+        # The ranking in use stays whole until the new one is built.
+        assert await leaderboard.top(3) == [(3, 75), (1, 10)]
+
+        resume.set()
+        await load
+
+    asyncio.run(main())
+
+    assert asyncio.run(leaderboard.top(3)) == [(3, 75), (1, 10)]
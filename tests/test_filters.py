@@ -0,0 +1,60 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from benchmarks.fixtures import make_avatar
+from boribay.core.utils import filters
+
+
+def make_frame(mode: str) -> Image.Image:
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (96, 128, 4), dtype=np.uint8)
+    # A fully transparent band and a half transparent one.
+    pixels[:32, :, 3] = 0
+    pixels[32:48, :, 3] = 128
+    return Image.fromarray(pixels, "RGBA").convert(mode)
+
+
+@pytest.mark.parametrize("mode", ("RGB", "RGBA"))
+@pytest.mark.parametrize("name", sorted(filters.OVERLAYS))
+def test_blend_array_matches_blend(name, mode):
+    layout, opacity = filters.OVERLAYS[name]
+    frame = make_frame(mode)
+
+    expected = filters.blend(frame, layout, opacity)
+    output = filters.blend_array(frame, layout, opacity)
+
+    assert output.mode == mode
+    assert np.array_equal(np.asarray(output), np.asarray(expected.convert(mode)))
+
+
+@pytest.mark.parametrize("mode", ("RGB", "RGBA", "L"))
+def test_pixelate_array_matches_pixelate(mode):
+    frame = Image.open(BytesIO(make_avatar(512))).convert(mode)
+
+    expected = np.asarray(filters.pixelate(frame), dtype=np.int16)
+    output = filters.pixelate_array(frame)
+
+    assert output.mode == mode
+    # Block means are not the triangle filter of BILINEAR, only close to it.
+    difference = np.abs(np.asarray(output, dtype=np.int16) - expected)
+    assert difference.mean() < 1
+    assert difference.max() <= 16
+
+
+@pytest.mark.parametrize(
+    "argument, image, chain",
+    (
+        ("jail|pixelate", None, "jail|pixelate"),
+        ("wanted|jail", None, "wanted|jail"),
+        ("pixelate 16|swirl 120", None, "pixelate 16|swirl 120"),
+        ("pixelate | jail", None, "pixelate | jail"),
+        ("@Dosek jail|pixelate", "@Dosek", "jail|pixelate"),
+        ("@Dosek pixelate | jail", "@Dosek", "pixelate | jail"),
+    ),
+)
+def test_split_image_takes_chains_without_spaces(argument, image, chain):
+    assert filters.split_image(argument) == (image, chain)
+    filters.parse_chain(chain)
@@ -0,0 +1,37 @@
+from io import BytesIO
+
+from PIL import Image
+
+from boribay.core.utils import manipulation
+
+
+class FakeWand:
+    """Records what would be decoded by ImageMagick."""
+
+    def __init__(self, *, file=None, blob=None):
+        self.data = file.read() if file is not None else blob
+
+
+def make_gif(frames: int, size=(300, 300)) -> bytes:
+    images = [Image.new("P", size, i % 256) for i in range(frames)]
+    buffer = BytesIO()
+    images[0].save(buffer, "gif", save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+
+def test_open_wand_keeps_only_the_first_frame(monkeypatch):
+    monkeypatch.setattr(manipulation, "WI", FakeWand)
+    data = make_gif(500)
+
+    wand = manipulation.open_wand(BytesIO(data), (87, 87))
+
+    with Image.open(BytesIO(wand.data)) as im:
+        assert getattr(im, "n_frames", 1) == 1
+        assert im.width <= 87 and im.height <= 87
+
+
+def test_open_wand_passes_small_still_images_as_they_are(monkeypatch):
+    monkeypatch.setattr(manipulation, "WI", FakeWand)
+    data = make_gif(1, (64, 64))
+
+    assert manipulation.open_wand(BytesIO(data), (87, 87)).data == data
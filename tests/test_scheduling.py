@@ -0,0 +1,53 @@
+import asyncio
+
+from boribay.core.utils.scheduling import RenderScheduler
+
+
+async def grant_order(weights: dict, renders: dict) -> list:
+    scheduler = RenderScheduler(concurrency=1, max_queue=32, max_per_user=32)
+
+    for guild_id, weight in weights.items():
+        scheduler.set_weight(guild_id, weight)
+
+    order = []
+    release = asyncio.Event()
+
+    async def blocker():
+        async with scheduler.slot(0, 0):
+            await release.wait()
+
+    async def render(guild_id: int):
+        async with scheduler.slot(guild_id, guild_id):
+            order.append(guild_id)
+
+    running = asyncio.create_task(blocker())
+    await asyncio.sleep(0)
+    tasks = [
+        asyncio.create_task(render(guild_id))
+        for guild_id, count in renders.items()
+        for _ in range(count)
+    ]
+    # Every render waits in the queue of its guild before the first grant.
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(running, *tasks)
+    return order
+
+
+def test_weighted_guild_gets_more_grants_per_turn():
+    order = asyncio.run(grant_order({1: 2, 2: 1}, {1: 4, 2: 2}))
+    assert order == [1, 1, 2, 1, 1, 2]
+
+
+def test_unweighted_guilds_take_turns():
+    order = asyncio.run(grant_order({}, {1: 3, 2: 3}))
+    assert order == [1, 2, 1, 2, 1, 2]
+
+
+def test_guild_change_hook_follows_the_weight_column():
+    scheduler = RenderScheduler(concurrency=1)
+    scheduler.on_guild_change("UPDATE", {"guild_id": 1, "render_weight": 3})
+    assert scheduler.weights == {1: 3}
+
+    scheduler.on_guild_change("DELETE", {"guild_id": 1, "render_weight": 3})
+    assert scheduler.weights == {}